@@ -9,7 +9,9 @@ class Basis:
         'kets',
         'numQubits',
         'ketSymbols',
-        'gateSymbol' # used for circuit representation of measurement
+        'gateSymbol', # used for circuit representation of measurement
+        'measurementGate', # rotates basis states onto computational basis states (None if basis is incomplete)
+        'isComputational'
     )
     def __init__(self, names, kets, ketSymbols, gateSymbol):
         if len(ketSymbols) != len(kets):
@@ -24,6 +26,14 @@ class Basis:
             self.density.append(
                 ketsToDensity([ket])
             )
+
+        # rows are the bras of each basis state, so outcome i of the measurement is computational basis state i
+        if len(kets) == 2**self.numQubits:
+            self.measurementGate = np.conj(np.stack(kets))
+            self.isComputational = np.allclose(self.measurementGate, np.eye(len(kets)))
+        else:
+            self.measurementGate = None
+            self.isComputational = False
     def __getitem__(self, i):
         return self.density[i]
 
@@ -43,6 +43,7 @@ def setupParsers():
     parser = argparse.ArgumentParser(description=description,formatter_class=ArgsOnce)
     parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
     parser.add_argument('FILE', type=str, help='the path to the file to execute (relative or absolute)')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='seed for the random number generator used by samp')
     parser.set_defaults(func = lambda args: baseHandler(args, parser))
 
     args = parser.parse_args()
@@ -53,5 +54,5 @@ def baseHandler(args,_):
     if not os.path.exists(filePath):
         print(f"File Not Found at Path: \n{filePath}")
     with open(filePath, 'r') as f:
-        executeFile(f)
+        executeFile(f, args.seed)
     #parser.print_help()
@@ -1,8 +1,8 @@
 import numpy as np
 import numpy.linalg as linalg
 from qbot.helpers import ensureSquare, log2
-import qbot.qgates as gates
 from typing import List, Tuple
+from functools import lru_cache
 
 def tensorProd(*args):
     if len(args) == 0:
@@ -29,7 +29,17 @@ def tensorExp(state, n):
     return tensorProd(*n*[state])
 
 def ketToDensity(ket: np.ndarray) -> np.ndarray:
-    return np.outer(ket,ket)
+    return np.outer(ket,ket.conj())
+
+def isKet(state: np.ndarray) -> bool:
+    '''pure states are stored as kets (1d arrays) until mixing occurs'''
+    return len(state.shape) == 1 and state.size != 0
+
+def stateToDensity(state: np.ndarray) -> np.ndarray:
+    '''promotes kets to density matrices, density matrices are returned as is'''
+    if isKet(state):
+        return ketToDensity(state)
+    return state
 
 def ketsToDensity(kets:list[np.ndarray],probs: list[float] = None) -> np.ndarray:
     '''converts set of kets to a density matrix'''
@@ -39,23 +49,20 @@ def ketsToDensity(kets:list[np.ndarray],probs: list[float] = None) -> np.ndarray
     if len(kets) != len(probs):
         raise Exception("number of state vectors an number of probabilites must equal")
 
-    result = np.zeros( (kets[0].shape[0],kets[0].shape[0]),dtype=complex )
-
-    for i,ket in enumerate(kets):
-        result += probs[i]* np.outer(ket,ket)
+    return ketEnsambleToDensity(probs, kets)
 
-    return result
+def ketEnsambleToDensity(probs: list[float], kets: list[np.ndarray]) -> np.ndarray:
+    '''sum of prob*|ket><ket| as a single einsum, kets may be a list or a stacked (m, d) array'''
+    # probs are not split as sqrt(prob) on both sides, which would not be exact
+    kets = np.asarray(kets)
+    return np.einsum('k,ki,kj->ij', np.asarray(probs, dtype = float), kets, kets.conj()).astype(complex, copy = False)
 
 def densityEnsambleToDensity(probs: list[float], densities: list[np.ndarray]):
+    '''sum of prob*density as a single tensordot, densities may be a list or a stacked (m, d, d) array'''
     if len(probs) != len(densities):
         raise Exception("number of state vectors an number of probabilites must equal")
 
-    result = np.zeros( densities[0].shape ,dtype=complex )
-
-    for i,density in enumerate(densities):
-        result += probs[i]* density
-
-    return result
+    return np.tensordot(np.asarray(probs, dtype = float), np.asarray(densities), 1).astype(complex, copy = False)
 
 
 def ketsToDensityZipped(pairs: List[Tuple[float, np.ndarray]]) -> np.ndarray:
@@ -66,12 +73,8 @@ def ketsToDensityZipped(pairs: List[Tuple[float, np.ndarray]]) -> np.ndarray:
     if len(pairs) == 1:
         return ketToDensity(pairs[0][1])
 
-
-    result = np.zeros( (pairs[0][1].shape[0], pairs[0][1].shape[0]),dtype=complex )
-
-    for prob, ket in pairs:
-        result += prob* np.outer(ket,ket)
-    return result
+    probs, kets = zip(*pairs)
+    return ketEnsambleToDensity(probs, kets)
 
 def normalizeDensity(density: np.ndarray):
     return density / np.trace(density)
@@ -119,8 +122,48 @@ def partialTraceBoth(density,nQubits,mQubits):
         )
     )
 
+# einsum sublists are cached per (numQubits, qubits) signature, density matrices are viewed as tensors with
+# axis i being the row index of qubit i and axis numQubits + i being the column index of qubit i
+
+@lru_cache(maxsize = 256)
+def _partialTraceSpec(numQubits: int, keptQubits: tuple) -> Tuple[list, list]:
+    '''einsum sublists which trace out all qubits not in keptQubits'''
+    rows = list(range(numQubits))
+    cols = [numQubits + q if q in keptQubits else q for q in range(numQubits)]
+    out = [q for q in keptQubits] + [numQubits + q for q in keptQubits]
+    return rows + cols, out
+
+@lru_cache(maxsize = 256)
+def _ketPartialTraceSpec(numQubits: int, keptQubits: tuple) -> Tuple[list, list, list]:
+    '''einsum sublists which produce the reduced density of keptQubits directly from a ket (and its conjugate)'''
+    ket = list(range(numQubits))
+    bra = [numQubits + q if q in keptQubits else q for q in range(numQubits)]
+    out = [q for q in keptQubits] + [numQubits + q for q in keptQubits]
+    return ket, bra, out
+
+@lru_cache(maxsize = 256)
+def _interweaveSpec(newSystemAQubits: tuple, newSystemBQubits: tuple) -> Tuple[list, list, list]:
+    '''einsum sublists which take the tensor product of system A and B, placing their qubits at the given positions'''
+    numQubits = len(newSystemAQubits) + len(newSystemBQubits)
+    systemA = list(newSystemAQubits) + [numQubits + q for q in newSystemAQubits]
+    systemB = list(newSystemBQubits) + [numQubits + q for q in newSystemBQubits]
+    return systemA, systemB, list(range(2*numQubits))
+
+def _partialTrace(tensor: np.ndarray, numQubits: int, keptQubits: tuple) -> np.ndarray:
+    inSubs, outSubs = _partialTraceSpec(numQubits, keptQubits)
+    dim = 2**len(keptQubits)
+    return np.einsum(tensor, inSubs, outSubs).reshape(dim, dim)
+
+def _partialTraceKet(tensor: np.ndarray, numQubits: int, keptQubits: tuple) -> np.ndarray:
+    ketSubs, braSubs, outSubs = _ketPartialTraceSpec(numQubits, keptQubits)
+    dim = 2**len(keptQubits)
+    return np.einsum(tensor, ketSubs, tensor.conj(), braSubs, outSubs).reshape(dim, dim)
+
 def partialTraceArbitrary(density: np.ndarray, numQubits: int, systemAQubits: list[int]):
-    size = ensureSquare(density)
+    '''
+    returns (systemA, systemB) where systemA is density with all qubits except systemAQubits traced out, and systemB
+    is density with systemAQubits traced out, density may also be a ket (both results are still density matrices)
+    '''
     systemAQubits = list(set(systemAQubits))
     systemAQubits.sort()
     if systemAQubits[0] < 0 or systemAQubits[-1] > numQubits-1:
@@ -128,24 +171,47 @@ def partialTraceArbitrary(density: np.ndarray, numQubits: int, systemAQubits: li
 
     systemBQubits = [i for i in range(0,numQubits) if i not in systemAQubits]
 
-    numSysAQubits = len(systemAQubits)
-    numSysBQubits = len(systemBQubits)
+    if isKet(density):
+        tensor = density.reshape((2,)*numQubits)
+        return (
+            _partialTraceKet(tensor, numQubits, tuple(systemAQubits)),
+            _partialTraceKet(tensor, numQubits, tuple(systemBQubits))
+        )
+
+    _ = ensureSquare(density)
+    tensor = density.reshape((2,)*(2*numQubits))
 
-    def stateMap(state):
-        res = 0
-        for i,aQubit in enumerate(systemAQubits):
-            mask = 1 << numQubits - aQubit - 1
-            res |= ((mask & state)!= 0) << (numQubits - 1 - i)
-        for i,bQubit in enumerate(systemBQubits):
-            mask = 1 << numQubits - bQubit - 1
-            res |= ((mask & state) != 0) << numSysBQubits - i - 1
-        return res
+    return (
+        _partialTrace(tensor, numQubits, tuple(systemAQubits)),
+        _partialTrace(tensor, numQubits, tuple(systemBQubits))
+    )
 
-    swapGate = gates.genArbitrarySwap(size, stateMap)
+def marginalProbs(state: np.ndarray, numQubits: int, keptQubits: list[int]) -> np.ndarray:
+    '''
+    probabilities of each computational basis state of keptQubits (sorted), read off the diagonal of state in
+    O(2^numQubits), state may be a ket or density matrix
+    '''
+    if isKet(state):
+        probs = np.abs(state)**2
+    else:
+        probs = np.diagonal(state).real
 
-    swappedDensity = swapGate @ density @ swapGate.conj().T
+    tracedQubits = tuple(q for q in range(numQubits) if q not in keptQubits)
+    return probs.reshape((2,)*numQubits).sum(axis = tracedQubits).reshape(-1)
 
-    return partialTraceBoth(swappedDensity,numSysAQubits,numSysBQubits)
+def dephase(density: np.ndarray, numQubits: int, qubits: list[int]) -> np.ndarray:
+    '''
+    zeros the blocks of density which are off diagonal in any of qubits (computational basis), ie) the state after a
+    non-selective measurement of qubits, done in one output buffer in O(4^numQubits)
+    '''
+    result = density.reshape((2,)*(2*numQubits)).copy()
+    for qubit in qubits:
+        for rowBit, colBit in ((0, 1), (1, 0)):
+            index = [slice(None)]*(2*numQubits)
+            index[qubit] = rowBit
+            index[numQubits + qubit] = colBit
+            result[tuple(index)] = 0
+    return result.reshape(density.shape)
 
 def interweaveDensities(systemADensity: np.ndarray, systemBDensity: np.ndarray, newSystemAQubits: list[int]):
     systemASize = ensureSquare(systemADensity)
@@ -173,23 +239,17 @@ def interweaveDensities(systemADensity: np.ndarray, systemBDensity: np.ndarray,
             continue
         newSystemBQubits.append(i)
 
+    # empty system B (ie) from measuring every qubit) is treated as the scalar 1
+    if systemBDensity.size == 0:
+        systemBDensity = np.ones((1,1), dtype = complex)
 
-    startSystemBQubits = systemANumQubits
-    def stateMap(state):
-        res = 0
-        for i,systemAIndex in enumerate(newSystemAQubits):
-            mask = 1 << numQubits - i - 1
-            res |= ((mask & state)!= 0) << (numQubits - 1 - systemAIndex)
-
-        for i,systemBIndex in enumerate(newSystemBQubits):
-            mask = 1 << numQubits - i-startSystemBQubits - 1
-            res |= ((mask & state)!= 0) << (numQubits - 1 - systemBIndex)
-        return res
-
-    swapGate = gates.genArbitrarySwap(2**(systemANumQubits + systemBNumQubits), stateMap)
-
-    swappedDensity = swapGate @ tensorProd(systemADensity, systemBDensity) @ swapGate.conj().T
-    return swappedDensity
+    aSubs, bSubs, outSubs = _interweaveSpec(tuple(newSystemAQubits), tuple(newSystemBQubits))
+    result = np.einsum(
+        systemADensity.reshape((2,)*(2*systemANumQubits)), aSubs,
+        systemBDensity.reshape((2,)*(2*systemBNumQubits)), bSubs,
+        outSubs
+    )
+    return result.reshape(2**numQubits, 2**numQubits)
 
 
 def replaceArbitrary(density: np.ndarray, newDensity: np.ndarray, qubitsToReplace: list[int]):
@@ -200,31 +260,65 @@ def replaceArbitrary(density: np.ndarray, newDensity: np.ndarray, qubitsToReplac
     if len(qubitsToReplace) != newQubits:
         raise ValueError(f'number of target qubits {len(qubitsToReplace)} does not equal number of provided qubits {newQubits}')
 
-    _, density = partialTraceArbitrary(density, numQubits, qubitsToReplace)
-    density = np.kron(density, newDensity)
+    if min(qubitsToReplace) < 0 or max(qubitsToReplace) > numQubits-1:
+        raise IndexError()
+
+    # only the untouched qubits are needed, so only trace out the replaced ones
+    keptQubits = tuple(i for i in range(numQubits) if i not in qubitsToReplace)
+    density = _partialTrace(density.reshape((2,)*(2*numQubits)), numQubits, keptQubits)
+
+    return interweaveDensities(newDensity, density, qubitsToReplace)
+
+
+def interweaveKets(systemAKet: np.ndarray, systemBKet: np.ndarray, newSystemAQubits: list[int]):
+    '''ket equivalent of interweaveDensities'''
+    systemANumQubits = log2(systemAKet.shape[0])
+    systemBNumQubits = log2(systemBKet.shape[0]) if systemBKet.size != 0 else 0
+    numQubits = systemANumQubits + systemBNumQubits
+
+    newSystemAQubits = sorted(set(newSystemAQubits))
+    if len(newSystemAQubits) != systemANumQubits:
+        raise ValueError()
+    if newSystemAQubits[0] < 0 or newSystemAQubits[-1] > numQubits-1:
+        raise IndexError()
 
-    newQubitsOffset = numQubits - len(qubitsToReplace)
-    def stateMap(state):
-        res = 0
+    if systemBKet.size == 0:
+        systemBKet = np.ones(1, dtype = complex)
+
+    newSystemBQubits = [i for i in range(numQubits) if i not in newSystemAQubits]
+    aSubs, bSubs, outSubs = _interweaveSpec(tuple(newSystemAQubits), tuple(newSystemBQubits))
+    result = np.einsum(
+        systemAKet.reshape((2,)*systemANumQubits), aSubs[:systemANumQubits],
+        systemBKet.reshape((2,)*systemBNumQubits), bSubs[:systemBNumQubits],
+        outSubs[:numQubits]
+    )
+    return result.reshape(2**numQubits)
 
-        qubitsToReplaceOffset = 0
 
-        for i in range(numQubits):
-            if qubitsToReplaceOffset < len(qubitsToReplace) and i == qubitsToReplace[qubitsToReplaceOffset]:
-                mask = 1 << numQubits -1 - newQubitsOffset - qubitsToReplaceOffset
-                res |= ((mask & state)!= 0) << (numQubits-1 - i)
+def replaceArbitraryKet(ket: np.ndarray, newKet: np.ndarray, qubitsToReplace: list[int]):
+    '''
+    ket equivalent of replaceArbitrary, returns None if the replaced qubits are entangled with the rest of ket (the
+    result would be mixed, so replaceArbitrary must be used instead)
+    '''
+    numQubits = log2(ket.shape[0])
+    newQubits = log2(newKet.shape[0])
+    if len(qubitsToReplace) != newQubits:
+        raise ValueError(f'number of target qubits {len(qubitsToReplace)} does not equal number of provided qubits {newQubits}')
 
-                qubitsToReplaceOffset+=1
-            else:
-                mask = 1 << numQubits-1 - i + qubitsToReplaceOffset
-                res |= ((mask & state)!= 0) << (numQubits-1 - i)
-        return res
+    if min(qubitsToReplace) < 0 or max(qubitsToReplace) > numQubits-1:
+        raise IndexError()
 
-    swapGate = gates.genArbitrarySwap(size, stateMap)
+    replacedQubits = sorted(set(qubitsToReplace))
+    keptQubits = [i for i in range(numQubits) if i not in replacedQubits]
 
-    swappedDensity = swapGate @ density @ swapGate.conj().T
+    # rows index the replaced qubits, columns index the kept qubits, ket is a product state iff this has rank 1
+    m = ket.reshape((2,)*numQubits).transpose(replacedQubits + keptQubits).reshape(2**len(replacedQubits), -1)
+    row = m[np.argmax(linalg.norm(m, axis = 1))]
+    keptKet = row / linalg.norm(row)
+    if not np.allclose(np.outer(m @ keptKet.conj(), keptKet), m):
+        return None
 
-    return swappedDensity
+    return interweaveKets(newKet, keptKet, replacedQubits)
 
 
 
@@ -39,6 +39,9 @@ def customInvalidMarkName(lines, lineNum, markName):
 def customUnknownMarkName(lines, lineNum, markName):
     return formatError(lines, lineNum, "UnknownMarkName", markName)
 
+def customUnknownNameError(lines, lineNum, names):
+    return formatError(lines, lineNum, "UnknownName", ", ".join(names))
+
 def customProbValCjmpError(lines, lineNum):
     return formatError(lines, lineNum, "ProbValCjmpError", "cjmp with a ProbVal condition requires a join mark (3rd argument) where both condition branches will be merged")
 
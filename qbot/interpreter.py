@@ -1,8 +1,10 @@
 import numpy as np
 import qbot.density as density
-from qbot.probVal import ProbVal
+from qbot.probVal import ProbVal, ApproximationPolicy, setApproximationPolicy
 import qbot.errors as err
-from qbot.operators import operations, OpReturn
+from qbot.operators import operations, definingOperations, jumpOperations, Mark, OpReturn
+from qbot.evaluation import codeCache, Expression, isPure, expressionNames, assignedNames, isDefined
+from typing import Callable, List, Tuple
 
 
 # MARK: removed probval control flow
@@ -111,33 +113,145 @@ def processLineIntoTokens(line:str):
 
     return tokens
 
+class Instruction:
+    '''a pre-parsed line, its operation is resolved and its arguments are already split'''
+    __slots__ = (
+        'op',
+        'lineNum',
+        'tokens',
+        'jumpIndex', # instruction jumped to, for jumps to marks resolved on load (None otherwise)
+    )
+    def __init__(self, op: Callable, lineNum: int, tokens: list[str], jumpIndex: int = None):
+        self.op = op
+        self.lineNum = lineNum
+        self.tokens = tokens
+        self.jumpIndex = jumpIndex
+
+
+def _raiseOnExecution(error: str) -> Callable:
+    '''op for lines which are invalid, the error is only raised if the line is reached'''
+    def op(localNameSpace, lines, lineNum, tokens):
+        err.raiseFormattedError(error)
+    return op
+
+def _resolveOp(lines, lineNum, tokens) -> Callable:
+    try:
+        op, argRangeStart, argRangeEnd = operations[tokens[0]]
+    except KeyError:
+        return _raiseOnExecution(err.customUnknownOperationError(lines, lineNum, tokens[0]))
+
+    numArgs = len(tokens) - 1
+    if numArgs < argRangeStart or numArgs > argRangeEnd:
+        return _raiseOnExecution(err.customNumArgumentsError(lines, lineNum, tokens[0], numArgs, argRangeStart, argRangeEnd))
+
+    return op
+
+def _scriptNames(tokenizedLines: List[list], localNameSpace: dict) -> set:
+    '''names the script may define (variables, assignment expressions) and those already in localNameSpace'''
+    names = set(localNameSpace)
+    for tokens in tokenizedLines:
+        if len(tokens) > 1 and tokens[0] in definingOperations:
+            names.add(tokens[1])
+        for token in tokens[1:]:
+            try:
+                names.update(assignedNames(token))
+            except SyntaxError:
+                pass
+    return names
+
+def _unknownNames(tokens: list, scriptNames: set) -> List[str]:
+    '''names used by the expression arguments of tokens which are neither global nor defined by the script'''
+    firstExpression = 2 if tokens[0] in definingOperations or tokens[0] in jumpOperations else 1
+    unknown = []
+    for token in tokens[firstExpression:]:
+        if not isinstance(token, Expression):
+            continue
+        for name in expressionNames(token):
+            if name not in scriptNames and name not in unknown and not isDefined(name):
+                unknown.append(name)
+    return unknown
+
+def _scriptMarks(tokenizedLines: List[list], localNameSpace: dict) -> dict:
+    '''mark name -> line of the mark, for every valid mark in the script'''
+    marks = dict(localNameSpace.get('__marks', {}))
+    for lineNum, tokens in enumerate(tokenizedLines):
+        if len(tokens) > 1 and tokens[0] == 'mark' and tokens[1].isidentifier():
+            marks[tokens[1]] = lineNum
+    return marks
+
+def compileLines(lines, localNameSpace: dict = None) -> Tuple[List[Instruction], List[int]]:
+    '''
+    returns the instructions for lines, and for each line (and one past the last) the index of the first instruction
+    on or after it, so line numbers returned by jumps map directly onto instructions
+    arguments which are valid expressions are compiled, and pure ones folded into constants (see evaluation.Expression)
+    names which are not defined anywhere (see _unknownNames) are checked here, rather than each time a line is evaluated
+    jumps to marks are resolved to the index of the instruction they jump to, jumps to mark names computed by an
+    expression are still resolved when they are reached
+    '''
+    localNameSpace = localNameSpace or {}
+    tokenizedLines = [processLineIntoTokens(line) for line in lines]
+    scriptNames = _scriptNames(tokenizedLines, localNameSpace)
+    marks = _scriptMarks(tokenizedLines, localNameSpace)
+
+    instructions = []
+    lineToInstruction = []
+    for lineNum, tokens in enumerate(tokenizedLines):
+        lineToInstruction.append(len(instructions))
+
+        if len(tokens) == 0 or tokens[0] == 'note' or tokens[0] == 'mark':
+            continue
+
+        isJump = tokens[0] in jumpOperations and len(tokens) > 1
+        if isJump and tokens[1] in marks:
+            tokens[1] = Mark(tokens[1], marks[tokens[1]])
+
+        for i in range(1, len(tokens)):
+            if isinstance(tokens[i], Mark):
+                continue
+            # not every argument is an expression, those which fail to compile are left for the operation to report
+            try:
+                code, names = codeCache.get(tokens[i])
+                tokens[i] = Expression(tokens[i], code, names, isPure(tokens[i]))
+            except Exception:
+                pass
+
+        op = _resolveOp(lines, lineNum, tokens)
+        # lines which are already invalid keep their error
+        if tokens[0] in operations and op is operations[tokens[0]][0]:
+            unknown = _unknownNames(tokens, scriptNames)
+            if len(unknown) != 0:
+                op = _raiseOnExecution(err.customUnknownNameError(lines, lineNum, unknown))
+
+            # identifiers which are not marks could only be variables holding a mark name
+            elif isJump and not isinstance(tokens[1], Mark) and tokens[1].isidentifier() \
+                    and tokens[1] not in scriptNames and not isDefined(tokens[1]):
+                op = _raiseOnExecution(err.customUnknownMarkName(lines, lineNum, tokens[1]))
+
+        instructions.append(Instruction(op, lineNum, tokens))
+
+    lineToInstruction.append(len(instructions))
+
+    for instruction in instructions:
+        if len(instruction.tokens) > 1 and isinstance(instruction.tokens[1], Mark):
+            instruction.jumpIndex = lineToInstruction[instruction.tokens[1].markLineNum]
+    return instructions, lineToInstruction
+
 def runtime(localNameSpace, lines, startLine = 0, endLine = -1):
     '''line end is not inclusive'''
-    startLine = max(startLine, 0)
+    startLine = min(max(startLine, 0), len(lines))
     endLine = len(lines) if endLine == -1 or endLine > len(lines) else endLine
 
-    lineNum = startLine-1
-    while lineNum != endLine - 1 and lineNum < len(lines) - 1:
-        lineNum += 1
-        tokens = processLineIntoTokens(lines[lineNum])
-
-        if len(tokens) == 0:
-            continue
-
-        tokens[0] = tokens[0].lower()
-        if tokens[0] == 'note' or tokens[0] == 'mark':
-            continue
+    instructions, lineToInstruction = compileLines(lines, localNameSpace)
 
-        try:
-            op, argRangeStart, argRangeEnd = operations[tokens[0]]
-        except KeyError:
-            err.raiseFormattedError(err.customUnknownOperationError(lines, lineNum, tokens[0]))
-
-        numArgs = len(tokens) - 1
-        if numArgs < argRangeStart or numArgs > argRangeEnd:
-            err.raiseFormattedError(err.customNumArgumentsError(lines, lineNum, tokens[0], numArgs, argRangeStart, argRangeEnd))
+    index = lineToInstruction[startLine]
+    numInstructions = len(instructions)
+    while index < numInstructions:
+        instruction = instructions[index]
+        if instruction.lineNum >= endLine:
+            break
+        index += 1
 
-        ret:OpReturn = op(localNameSpace, lines, lineNum, tokens)
+        ret:OpReturn = instruction.op(localNameSpace, lines, instruction.lineNum, instruction.tokens)
         if ret is None:
             continue
 
@@ -176,7 +290,10 @@ def runtime(localNameSpace, lines, startLine = 0, endLine = -1):
         if ret.jumpLineNum is None:
             continue
         if isinstance(ret.jumpLineNum, int):
-            lineNum = ret.jumpLineNum - 1
+            if instruction.jumpIndex is not None:
+                index = instruction.jumpIndex
+            else:
+                index = lineToInstruction[min(max(ret.jumpLineNum, 0), len(lines))]
             continue
         #if isinstance(ret.jumpLineNum, ProbVal):
         #    assert ret.joinLineNum is not None
@@ -214,23 +331,31 @@ def runtime(localNameSpace, lines, startLine = 0, endLine = -1):
         #    lineNum = joinLine - 1
         #    continue
 
-def _execute(lines: list[str]):
+def _execute(lines: list[str], seed = None):
     state = np.array([], dtype = complex)
     localNameSpace = {
         'state': state,
         f'__updated_state': False,
         '__marks': dict(),
         '__prev_jump': -1,
+        '__rng': np.random.default_rng(seed),
     }
 
-    recordMarks(localNameSpace, lines)
-    runtime(localNameSpace, lines)
+    # scripts start with the default policy (see approximate), the caller's policy is restored afterwards
+    previousPolicy = setApproximationPolicy(ApproximationPolicy())
+    try:
+        recordMarks(localNameSpace, lines)
+        runtime(localNameSpace, lines)
+    finally:
+        setApproximationPolicy(previousPolicy)
 
     return localNameSpace
 
-def executeFile(file):
-    return _execute(file.readlines())
+def executeFile(file, seed = None):
+    '''seed is used for the random number generator of samp'''
+    return _execute(file.readlines(), seed)
 
-def executeTxt(text: str):
-    return _execute(text.splitlines())
+def executeTxt(text: str, seed = None):
+    '''seed is used for the random number generator of samp'''
+    return _execute(text.splitlines(), seed)
 
@@ -2,21 +2,59 @@ import numpy as np
 
 from qbot.basis import Basis
 from qbot.probVal import ProbVal, probRounding
-from qbot.density import densityEnsambleToDensity, tensorProd, partialTraceArbitrary, interweaveDensities
+from qbot.density import densityEnsambleToDensity, tensorProd, partialTraceArbitrary, interweaveDensities, isKet, ketToDensity, marginalProbs, stateToDensity, dephase
+from qbot.qgates import applyLocalGate, applyQubitPermutation
 from qbot.helpers import ensureSquare, log2
 
-from typing import Union
+from typing import Union, Callable
+
+class BasisStates:
+    '''
+    list like view of the tensor products of basis states (or their symbols) ordered as in permuteBasis, each is
+    computed on access rather than stored
+    '''
+    __slots__ = (
+        'basis',
+        'numTensProd',
+        'symbols'
+    )
+    def __init__(self, basis: Basis, numTensProd: int, symbols = False):
+        self.basis = basis
+        self.numTensProd = numTensProd
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.basis.kets)**self.numTensProd
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("basis state index out of range")
+
+        if self.symbols:
+            return permuteBasisSymbol(self.numTensProd, i, self.basis)
+        return tensorPermute(self.numTensProd, i, self.basis)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
 
 class MeasurementResult:
     __slots__ = (
-        'unMeasuredDensity',
+        '_unMeasuredDensity',
         'probs',
-        'basisDensity',
-        'basisSymbols',
+        'basis',
+        'numTensProd',
         'newState'
     )
-    def __init__(self, unMeasuredDensity: np.ndarray, probs: list[float], basisDensity: list[np.ndarray], basisSymbols:list[str], newState = None):
-        self.unMeasuredDensity = unMeasuredDensity
+    def __init__(self, unMeasuredDensity: Union[np.ndarray, Callable[[], np.ndarray]], probs: list[float], basis: Basis, numTensProd: int, newState = None):
+        '''unMeasuredDensity may be a function which computes it, it is then only called on first access'''
+        self._unMeasuredDensity = unMeasuredDensity
         self.probs = probs
 
         s = sum(self.probs)
@@ -24,49 +62,115 @@ class MeasurementResult:
             self.probs[i] /= s
             self.probs[i] = round(self.probs[i], probRounding)
 
-        self.basisDensity = basisDensity
-        self.basisSymbols = basisSymbols
+        self.basis = basis
+        self.numTensProd = numTensProd
         self.newState = newState
 
+    @property
+    def unMeasuredDensity(self) -> np.ndarray:
+        if callable(self._unMeasuredDensity):
+            self._unMeasuredDensity = self._unMeasuredDensity()
+        return self._unMeasuredDensity
+
+    @property
+    def basisDensity(self) -> BasisStates:
+        return BasisStates(self.basis, self.numTensProd)
+
+    @property
+    def basisSymbols(self) -> BasisStates:
+        return BasisStates(self.basis, self.numTensProd, symbols = True)
+
     def __repr__(self):
         s = ''
         for i, prob in enumerate(self.probs):
-            s += f'{self.basisSymbols[i]}- {prob} ({prob*100}%)\n'
+            s += f'{permuteBasisSymbol(self.numTensProd, i, self.basis)}- {prob} ({prob*100}%)\n'
         return s
 
     # somewhat unnessisary given self.newState
     def toDensity(self):
-        return densityEnsambleToDensity(self.probs, self.basisDensity)
+        if self.basis.measurementGate is None:
+            return densityEnsambleToDensity(self.probs, self.basisDensity)
+
+        # complete basis, the mixture of basis states is diag(probs) rotated out of the measurement frame
+        # (as in _measuredState), rather than a sum over every basis density matrix
+        density = np.diag(np.asarray(self.probs, dtype = complex))
+        if self.basis.isComputational:
+            return density
+
+        inverseGate = self.basis.measurementGate.conj().T
+        for i in range(self.numTensProd):
+            density = applyLocalGate(inverseGate, density, i*self.basis.numQubits)
+        return density
 
     @staticmethod
     def fromProbVal(pv: ProbVal):
-        assert len(ProbVal.probs) > 0
+        assert len(pv.probs) > 0
 
-        newProbs = []
+        # note we are assuming that the basis for all measurements in probval are the same, asserting this would require alot of comparisons
         meas = pv.values[0]
-        assert isinstance(meas, MeasurementResult)
-        newProbs = meas.probs.copy()
-        for i in range(1, len(pv.probs)):
-            prob = pv.probs[i]
-            meas = pv.values[i]
-            assert isinstance(meas, MeasurementResult)
-            assert len(meas.probs) == len(newProbs)
-            for measProb in meas.probs:
-                newProbs[i] += prob*measProb
-
-        s = sum(newProbs)
-        for i in range(len(newProbs)):
-            newProbs[i] /= s
+        for m in pv.values:
+            assert isinstance(m, MeasurementResult)
+            assert len(m.probs) == len(meas.probs)
+        newProbs = np.tensordot(np.asarray(pv.probs), np.array([m.probs for m in pv.values]), 1).tolist()
 
-        # note we are assuming that the basis for all measurements in probval are the same, asserting this would require alot of comparisons
-        unMeasuredDensity = densityEnsambleToDensity(pv.probs, [m.unMeasuredDensity for m in pv.values])
+        unMeasuredDensity = lambda: densityEnsambleToDensity(pv.probs, [m.unMeasuredDensity for m in pv.values])
 
         # note we assume that if one MeasurementResult has a newState, then they all do
         if meas.newState is not None:
-            newState = densityEnsambleToDensity(pv.probs, [m.newState for m in pv.values])
-            return MeasurementResult(unMeasuredDensity, newProbs, meas.basisDensity, meas.basisSymbols, newState)
+            newState = densityEnsambleToDensity(pv.probs, [stateToDensity(m.newState) for m in pv.values])
+            return MeasurementResult(unMeasuredDensity, newProbs, meas.basis, meas.numTensProd, newState)
+
+        return MeasurementResult(unMeasuredDensity, newProbs, meas.basis, meas.numTensProd)
+
+
+class SampleResult:
+    '''outcome counts of shots drawn from a measurement, keyed by basis symbols (or outcome index)'''
+    __slots__ = (
+        'counts',
+        'shots',
+        'basis',
+        'numTensProd'
+    )
+    def __init__(self, counts: np.ndarray, basis: Basis, numTensProd: int):
+        self.counts = counts
+        self.shots = int(counts.sum())
+        self.basis = basis
+        self.numTensProd = numTensProd
+
+    def __getitem__(self, key: Union[str, int]) -> int:
+        if isinstance(key, str):
+            key = symbolToIndex(self.numTensProd, key, self.basis)
+        return int(self.counts[key])
+
+    def __len__(self):
+        return len(self.counts)
+
+    def keys(self):
+        return [symbol for symbol, _ in self.items()]
+
+    def items(self):
+        '''(symbol, count) pairs of every outcome which occurred'''
+        return [(permuteBasisSymbol(self.numTensProd, i, self.basis), int(self.counts[i])) for i in np.flatnonzero(self.counts)]
+
+    def toDict(self):
+        return dict(self.items())
+
+    @property
+    def probs(self) -> list[float]:
+        return (self.counts / max(self.shots, 1)).tolist()
+
+    def __repr__(self):
+        s = ''
+        for symbol, count in self.items():
+            s += f'{symbol}- {count} ({count/self.shots*100}%)\n'
+        return s
+
 
-        return MeasurementResult(unMeasuredDensity, newProbs, meas.basisDensity, meas.basisSymbols)
+def sampleMeasurement(result: MeasurementResult, shots: int, rng: np.random.Generator) -> SampleResult:
+    '''draws shots outcomes of result with a single multinomial draw'''
+    probs = np.asarray(result.probs, dtype = float)
+    counts = rng.multinomial(shots, probs / probs.sum())
+    return SampleResult(counts, result.basis, result.numTensProd)
 
 
 def tensorPermute(numTensProd: int, n: int, d: Union[list[np.ndarray], Basis]):
@@ -100,16 +204,98 @@ def permuteBasis(numTensProd: int, n: int, basis: Basis):
 
     return state, s
 
+def permuteBasisSymbol(numTensProd: int, n: int, basis: Basis) -> str:
+    '''symbol of permuteBasis(numTensProd, n, basis) without building the basis state'''
+    s = ''
+    remainingIndex = n
+    for _ in range(numTensProd):
+        s = basis.ketSymbols[remainingIndex%len(basis.kets)] + s
+        remainingIndex //= len(basis.kets)
+    return s
+
+
+def symbolToIndex(numTensProd: int, symbol: str, basis: Basis) -> int:
+    '''inverse of permuteBasisSymbol'''
+    index = 0
+    remaining = symbol
+    for _ in range(numTensProd):
+        for i, ketSymbol in enumerate(basis.ketSymbols):
+            if remaining.startswith(ketSymbol):
+                index = index*len(basis.kets) + i
+                remaining = remaining[len(ketSymbol):]
+                break
+        else:
+            raise KeyError(symbol)
+
+    if remaining != '':
+        raise KeyError(symbol)
+    return index
+
 
 class MeasurementIndexError(Exception):
     pass
 
+def _measurementProbs(state: np.ndarray, systemA: np.ndarray, numQubits: int, targets: list[int], basis: Basis) -> np.ndarray:
+    '''
+    probabilities of every outcome (ordered as in permuteBasis) for a complete basis, read off the diagonal after
+    rotating the targets into the measurement frame with one local gate per tensor product factor
+    '''
+    numTargets = len(targets)
+    if basis.isComputational:
+        return marginalProbs(state, numQubits, targets)
+
+    # rotating the ket is cheaper than forming the reduced density of the targets
+    if isKet(state):
+        frame = applyQubitPermutation(targets + [q for q in range(numQubits) if q not in targets], state)
+        frameNumQubits = numQubits
+    else:
+        frame = systemA
+        frameNumQubits = numTargets
+
+    for firstTarget in range(0, numTargets, basis.numQubits):
+        frame = applyLocalGate(basis.measurementGate, frame, firstTarget)
+
+    return marginalProbs(frame, frameNumQubits, list(range(numTargets)))
+
+def _measuredState(state: np.ndarray, numQubits: int, targets: list[int], basis: Basis) -> np.ndarray:
+    '''post measurement state for a complete basis, state with its off diagonal blocks zeroed in the measurement frame'''
+    state = stateToDensity(state)
+    if basis.isComputational:
+        return dephase(state, numQubits, targets)
+
+    # states of multi qubit bases act on adjacent qubits, so move the targets to the front
+    if basis.numQubits > 1:
+        qubitOrder = targets + [q for q in range(numQubits) if q not in targets]
+        frame = applyQubitPermutation(qubitOrder, state)
+        frameTargets = list(range(len(targets)))
+    else:
+        frame = state
+        frameTargets = targets
+
+    firstTargets = frameTargets[::basis.numQubits]
+    for firstTarget in firstTargets:
+        frame = applyLocalGate(basis.measurementGate, frame, firstTarget)
+
+    frame = dephase(frame, numQubits, frameTargets)
+
+    inverseGate = basis.measurementGate.conj().T
+    for firstTarget in firstTargets:
+        frame = applyLocalGate(inverseGate, frame, firstTarget)
+
+    if basis.numQubits > 1:
+        return applyQubitPermutation(np.argsort(qubitOrder).tolist(), frame)
+    return frame
+
 def measureArbitraryMultiState(state: np.ndarray, basis: Basis, toMeasure = None, returnState = True):
-    '''measures all targets in toMeasure, if basis states are smaller than the number of targets, will measure in basis of tensorproducts of basis states'''
-    numQubits = log2(ensureSquare(state))
+    '''
+    measures all targets in toMeasure, if basis states are smaller than the number of targets, will measure in basis of tensorproducts of basis states
+    state may be a ket or a density matrix, the resulting newState is always a density matrix
+    '''
+    numQubits = log2(state.shape[0]) if isKet(state) else log2(ensureSquare(state))
 
     if toMeasure is None:
         numTargets = numQubits
+        targets = list(range(numQubits))
     else:
         if isinstance(toMeasure,set):
             toMeasure = list(toMeasure)
@@ -121,6 +307,7 @@ def measureArbitraryMultiState(state: np.ndarray, basis: Basis, toMeasure = None
                 raise MeasurementIndexError(f"measurement target {target} outside of valid range [{0}, {numQubits - 1}]", target, 0, numQubits - 1)
 
         numTargets = len(toMeasure)
+        targets = sorted(toMeasure)
 
     basisQubitSize = log2(ensureSquare(basis.density[0]))
 
@@ -131,36 +318,94 @@ def measureArbitraryMultiState(state: np.ndarray, basis: Basis, toMeasure = None
         raise ValueError(f"number of qubits to measure {numTargets} must be divisable by the number of qubits in the basis states {basisQubitSize}")
 
 
-    if toMeasure is None or len(toMeasure) == numQubits:
-        systemA = state
-        systemB = np.array([], dtype=complex)
-
-    else:
-        systemA, systemB = partialTraceArbitrary(state, numQubits, toMeasure)
-
     numTensProd = numTargets // basisQubitSize
 
-    probs = []
-    basisStates = []
-    basisSymbols = []
-    s = 0
-    for i in range(0, len(basis.density)**numTensProd):
-        basisState, basisStateSymbol = permuteBasis(numTensProd, i, basis)
-        probs.append(
-            abs(np.trace(np.matmul(systemA, basisState)))
-        )
-        basisStates.append(basisState)
-        basisSymbols.append(basisStateSymbol)
+    def reducedDensity():
+        if numTargets == numQubits:
+            return stateToDensity(state)
+        return partialTraceArbitrary(state, numQubits, targets)[0]
 
-        s += probs[-1]
+    # incomplete basis, probabilities require the trace against each projector
+    if basis.measurementGate is None:
+        systemA = reducedDensity()
+        basisStates = BasisStates(basis, numTensProd)
+        probs = [abs(np.trace(np.matmul(systemA, basisState))) for basisState in basisStates]
+        s = sum(probs)
+        for i in range(0,len(probs)):
+            probs[i] /= s
 
-    for i in range(0,len(probs)):
-        probs[i] /= s
+        if not returnState:
+            return MeasurementResult(systemA, probs, basis, numTensProd)
 
-    if returnState:
         measured = densityEnsambleToDensity(probs, basisStates)
-        if toMeasure is None:
-            return MeasurementResult(systemA, probs, basisStates, basisSymbols, measured)
-        return MeasurementResult(systemA, probs, basisStates, basisSymbols, interweaveDensities(measured, systemB, toMeasure))
-    return MeasurementResult(systemA, probs, basisStates, basisSymbols)
+        if numTargets == numQubits:
+            return MeasurementResult(systemA, probs, basis, numTensProd, measured)
+        _, systemB = partialTraceArbitrary(state, numQubits, targets)
+        return MeasurementResult(systemA, probs, basis, numTensProd, interweaveDensities(measured, systemB, targets))
+
+    # only rotating a density into the measurement frame requires the reduced density up front
+    if basis.isComputational or isKet(state):
+        systemA = reducedDensity
+    else:
+        systemA = reducedDensity()
 
+    probs = np.clip(_measurementProbs(state, systemA, numQubits, targets, basis), 0, None)
+    probs = (probs / probs.sum()).tolist()
+
+    if returnState:
+        return MeasurementResult(systemA, probs, basis, numTensProd, _measuredState(state, numQubits, targets, basis))
+    return MeasurementResult(systemA, probs, basis, numTensProd)
+
+
+def _queryTargets(state: np.ndarray, targets) -> tuple[int, list[int]]:
+    numQubits = log2(state.shape[0])
+    if targets is None:
+        return numQubits, list(range(numQubits))
+
+    # a single target, as accepted by meas
+    if isinstance(targets, (int, np.integer)):
+        targets = [targets]
+
+    targets = list(targets)
+    if len(set(targets)) != len(targets):
+        raise ValueError(f"targets {targets} must be unique")
+    for target in targets:
+        if target < 0 or target > numQubits - 1:
+            raise MeasurementIndexError(f"measurement target {target} outside of valid range [{0}, {numQubits - 1}]", target, 0, numQubits - 1)
+    return numQubits, targets
+
+def probOf(state: np.ndarray, bitstring: Union[str, int], targets = None) -> float:
+    '''
+    probability of measuring bitstring on targets (all qubits if None) in the computational basis, bitstring[i] is the
+    outcome of targets[i], reads only the matching diagonal entries of state (a single entry if all qubits are targeted)
+    '''
+    numQubits, targets = _queryTargets(state, targets)
+
+    if isinstance(bitstring, str):
+        if len(bitstring) != len(targets) or not set(bitstring) <= {'0', '1'}:
+            raise ValueError(f"bitstring {bitstring} must be {len(targets)} characters of 0 or 1")
+        bits = [int(bit) for bit in bitstring]
+    else:
+        if bitstring < 0 or bitstring >= 2**len(targets):
+            raise ValueError(f"bitstring {bitstring} outside of valid range [0, {2**len(targets) - 1}]")
+        bits = [(bitstring >> (len(targets) - 1 - i)) & 1 for i in range(len(targets))]
+
+    index = numQubits*[slice(None)]
+    for target, bit in zip(targets, bits):
+        index[target] = bit
+    index = tuple(index)
+
+    if isKet(state):
+        return float(np.sum(np.abs(state.reshape((2,)*numQubits)[index])**2))
+    return float(np.sum(np.diagonal(state).reshape((2,)*numQubits)[index].real))
+
+def marginal(state: np.ndarray, targets = None) -> np.ndarray:
+    '''
+    probabilities of each computational basis state of targets (all qubits if None), ordered such that targets[0] is the
+    most significant bit, computed from the diagonal of state in O(2^n)
+    '''
+    numQubits, targets = _queryTargets(state, targets)
+    sortedTargets = sorted(targets)
+
+    probs = marginalProbs(state, numQubits, sortedTargets).reshape((2,)*len(targets))
+    return probs.transpose([sortedTargets.index(target) for target in targets]).reshape(-1)
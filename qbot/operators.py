@@ -1,9 +1,10 @@
+import numbers
 import numpy as np
 
 import qbot.basis as basis
 from qbot.probVal import ProbVal, funcWrapper
 from qbot.evaluation import evaluateWrapper
-from qbot.measurement import measureArbitraryMultiState, MeasurementResult, MeasurementIndexError
+from qbot.measurement import measureArbitraryMultiState, MeasurementResult, MeasurementIndexError, sampleMeasurement
 import qbot.density as density
 import qbot.qgates as gates
 import qbot.errors as err
@@ -25,10 +26,21 @@ def hilbertSpaceDim(state):
 def getVarName(lines, lineNum, token):
     if not token.isidentifier():
         err.raiseFormattedError(err.customInvalidVariableName(lines, lineNum, token))
-    return token
+    # tokens may be evaluation.Expression
+    return str(token)
 
 
+class Mark(str):
+    '''mark name resolved when the script is loaded (see interpreter.compileLines), with the line of the mark'''
+    def __new__(cls, name: str, markLineNum: int):
+        self = super().__new__(cls, name)
+        self.markLineNum = markLineNum
+        return self
+
 def getMarkLineNum(localNameSpace, lines, lineNum, token) -> int:
+    if isinstance(token, Mark):
+        return token.markLineNum
+
     if token.isidentifier() and token in localNameSpace['__marks'].keys():
         return localNameSpace['__marks'][token]
 
@@ -57,7 +69,8 @@ def assertProbValType(lines, lineNum, pv, t):
     err.raiseFormattedError(err.customTypeError(lines, lineNum, [t.__name__, f"ProbVal<{t.__name__}>"], type(pv).__name__))
 
 
-def convertToDensity(lines, lineNum, val):
+def convertToState(lines, lineNum, val):
+    '''kets are kept as kets (pure states), ProbVals are mixed into a density matrix'''
     if isinstance(val, ProbVal):
         try:
             return val.toDensityMatrix()
@@ -67,14 +80,16 @@ def convertToDensity(lines, lineNum, val):
     if not isinstance(val, np.ndarray):
         err.raiseFormattedError(err.customTypeError(lines, lineNum, ['np.ndarray', 'ProbVal<np.ndarray>'], type(val).__name__))
 
-    if len(val.shape) == 1:
-        np.outer(val, val)
     return val
 
 
+def convertToDensity(lines, lineNum, val):
+    return density.stateToDensity(convertToState(lines, lineNum, val))
+
+
 def setVal(localNameSpace, lines, lineNum, key, value, qset = True):
     if qset:
-        localNameSpace[key] = convertToDensity(lines, lineNum, value)
+        localNameSpace[key] = convertToState(lines, lineNum, value)
         localNameSpace[f'__is_q_{key}'] = True
     else:
         localNameSpace[key] = value
@@ -99,7 +114,7 @@ def ensureContainer(lines, lineNum, val, requiredType = int):
         return val
 
     if isinstance(val, ProbVal):
-        for i,pvItem in enumerate(val.values):
+        for pvItem in val.values:
             if isinstance(pvItem,list) or isinstance(pvItem, set) or isinstance(pvItem, tuple):
                 for item in pvItem:
                     if not isinstance(item, requiredType):
@@ -108,8 +123,9 @@ def ensureContainer(lines, lineNum, val, requiredType = int):
 
             if not isinstance(pvItem, requiredType):
                 _ensureContainerErr(lines, lineNum, val, requiredType)
-            val.values[i] = [pvItem]
-        return val
+
+        # ProbVals are not mutated, as they may be shared
+        return val.map(lambda pvItem: pvItem if isinstance(pvItem, (list, set, tuple)) else [pvItem])
 
     if not isinstance(val, requiredType):
         _ensureContainerErr(lines, lineNum, val, requiredType)
@@ -135,8 +151,15 @@ def _qset(val, localNameSpace, lines, lineNum, numQubits, targets):
         if target < 0 or target > numQubits - 1:
             err.raiseFormattedError(err.customIndexError(lines, lineNum, 'target', target, numQubits - 1))
 
+    state = localNameSpace['state']
     try:
-        return density.replaceArbitrary(localNameSpace['state'], val, targets)
+        # stays pure if the replaced qubits are not entangled with the rest of the state
+        if density.isKet(state) and density.isKet(val):
+            newState = density.replaceArbitraryKet(state, val, targets)
+            if newState is not None:
+                return newState
+
+        return density.replaceArbitrary(density.stateToDensity(state), density.stateToDensity(val), targets)
     except ValueError as e:
         err.raiseFormattedError(err.pythonError(lines,lineNum, e))
 
@@ -146,7 +169,7 @@ def qset(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     numQubits = hilbertSpaceNumQubits(localNameSpace['state'])
 
     x = evaluateWrapper(lines, lineNum, tokens[1], localNameSpace)
-    val = convertToDensity(lines, lineNum, x)
+    val = convertToState(lines, lineNum, x)
 
     if len(tokens) == 2:
         setVal(localNameSpace, lines, lineNum, 'state', val, qset = True)
@@ -155,14 +178,14 @@ def qset(localNameSpace, lines, lineNum, tokens) -> OpReturn:
         targets = ensureContainer(lines, lineNum, evaluateWrapper(lines, lineNum, tokens[2], localNameSpace))
 
         if isinstance(targets, ProbVal):
-            density = funcWrapper(_qset, val, localNameSpace, lines, lineNum, numQubits, targets)
-            if isinstance(density, ProbVal):
-                density = density.toDensityMatrix()
-            setVal(localNameSpace, lines, lineNum, 'state', density, qset = True)
+            newState = funcWrapper(_qset, val, localNameSpace, lines, lineNum, numQubits, targets)
+            if isinstance(newState, ProbVal):
+                newState = newState.toDensityMatrix()
+            setVal(localNameSpace, lines, lineNum, 'state', newState, qset = True)
             return
 
-        density = _qset(val, localNameSpace, lines, lineNum, numQubits, targets)
-        setVal(localNameSpace, lines, lineNum, 'state', density, qset = True)
+        newState = _qset(val, localNameSpace, lines, lineNum, numQubits, targets)
+        setVal(localNameSpace, lines, lineNum, 'state', newState, qset = True)
         return
 
 
@@ -215,7 +238,6 @@ def cjmp(localNameSpace, lines, lineNum, tokens) -> OpReturn:
 
         #if not len(tokens) == 4:
         #    err.raiseFormattedError(err.customProbValCjmpError(lines, lineNum))
-        #joinLineNum = getMarkLineNum(localNameSpace, lines, lineNum, tokens[3])
 
         #jumpLineNum = ProbVal.fromUnzipped([trueProb, falseProb], [markLineNum, lineNum + 1])
         #return OpReturnVal(jumpLineNum, joinLineNum)
@@ -239,7 +261,7 @@ def qjmp(localNameSpace, lines, lineNum, tokens) -> OpReturn:
 def cdef(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     varName = getVarName(lines, lineNum, tokens[1])
 
-    val = evaluateWrapper(lines, lineNum, tokens[2], localNameSpace)
+    val = evaluateWrapper(lines, lineNum, tokens[2], localNameSpace, observeResult = False)
     setVal(localNameSpace, lines, lineNum, varName, val, qset = False)
 
 
@@ -252,15 +274,11 @@ def qdef(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     setVal(localNameSpace, lines, lineNum, varName, val, qset = True)
 
 
-def _gate(lines, lineNum, numQubits, contorls, firstTarget, gate):
-    gateSize = hilbertSpaceNumQubits(gate)
+def _checkGateLayout(lines, lineNum, numQubits, contorls, firstTarget, gateSize):
     lastTarget = firstTarget+gateSize - 1
     if firstTarget < 0 or lastTarget > numQubits - 1:
         err.raiseFormattedError(err.customIndexError(lines, lineNum, 'target', firstTarget, numQubits - gateSize))
 
-    if len(contorls) == 0:
-        return gates.genGateForFullHilbertSpace(numQubits, firstTarget, gate)
-
     for control in contorls:
         if control < 0 or control > numQubits-1:
             err.raiseFormattedError(err.customIndexError(lines, lineNum, 'control', control, numQubits-1))
@@ -268,7 +286,39 @@ def _gate(lines, lineNum, numQubits, contorls, firstTarget, gate):
         if control >= firstTarget and control <= lastTarget:
             err.raiseFormattedError(err.customControlTargetOverlapError(lines, lineNum, control, firstTarget, lastTarget))
 
-    return gates.genMultiControlledGate(numQubits, contorls, firstTarget, gate)
+def _gate(lines, lineNum, state, numQubits, contorls, firstTarget, gate):
+    '''returns state after gate is applied'''
+    _checkGateLayout(lines, lineNum, numQubits, contorls, firstTarget, hilbertSpaceNumQubits(gate))
+
+    if len(contorls) == 0:
+        return gates.applyLocalGate(gate, state, firstTarget)
+
+    return gates.applyControlledGate(gate, state, contorls, firstTarget)
+
+def _gateBranches(lines, lineNum, state, numQubits, contorls, firstTarget, gate):
+    '''
+    returns state after a ProbVal gate (or gate with ProbVal targets/controls) is applied,
+    branches sharing a target and control layout are applied together (see gates.applyGateEnsamble)
+    '''
+    branches = funcWrapper(lambda c, t, g: (tuple(c), t, g), contorls, firstTarget, gate)
+    if not isinstance(branches, ProbVal):
+        contorls, firstTarget, gate = branches
+        return _gate(lines, lineNum, state, numQubits, list(contorls), firstTarget, gate)
+
+    # (controls, target, gate shape) -> (probs, gates)
+    groups = {}
+    for prob, (branchControls, branchTarget, branchGate) in zip(branches.probs, branches.values):
+        probs, branchGates = groups.setdefault((branchControls, branchTarget, branchGate.shape), ([], []))
+        probs.append(prob)
+        branchGates.append(branchGate)
+
+    result = None
+    for (branchControls, branchTarget, _), (probs, branchGates) in groups.items():
+        _checkGateLayout(lines, lineNum, numQubits, branchControls, branchTarget, hilbertSpaceNumQubits(branchGates[0]))
+        mixed = gates.applyGateEnsamble(probs, np.stack(branchGates), state, list(branchControls), branchTarget)
+        result = mixed if result is None else result + mixed
+
+    return result
 
 
 def gate(localNameSpace, lines, lineNum, tokens) -> OpReturn:
@@ -305,26 +355,24 @@ def gate(localNameSpace, lines, lineNum, tokens) -> OpReturn:
         return
 
     try:
-        g = funcWrapper( _gate, lines, lineNum, numQubits, controls, firstTarget, gate )
+        if isinstance(gate, ProbVal) or isinstance(firstTarget, ProbVal) or isinstance(controls, ProbVal):
+            val = _gateBranches(lines, lineNum, localNameSpace['state'], numQubits, controls, firstTarget, gate)
+        else:
+            val = _gate(lines, lineNum, localNameSpace['state'], numQubits, controls, firstTarget, gate)
     except Exception as e:
         err.raiseFormattedError(err.pythonError(lines, lineNum ,e))
 
-
-    if isinstance(g, ProbVal):
-        for i in range(len(g.values)):
-            g.values[i] = gates.applyGate(g.values[i], localNameSpace['state'])
-        val = g.toDensityMatrix()
-    elif isinstance(g, np.ndarray):
-        val = gates.applyGate(g, localNameSpace['state'])
-    else:
+    if not isinstance(val, np.ndarray):
         raise Exception("gate is not array or ProbVal")
 
 
     if isinstance(applicationCondition, ProbVal):
+        val = density.stateToDensity(val)
+        state = density.stateToDensity(localNameSpace['state'])
         if applicationCondition.values[0]:
-            val = density.densityEnsambleToDensity(applicationCondition.probs, [val, localNameSpace['state']])
+            val = density.densityEnsambleToDensity(applicationCondition.probs, [val, state])
         else:
-            val = density.densityEnsambleToDensity(applicationCondition.probs, [localNameSpace['state'], val])
+            val = density.densityEnsambleToDensity(applicationCondition.probs, [state, val])
 
     setVal(localNameSpace, lines, lineNum, 'state', val, qset = True)
 
@@ -344,30 +392,27 @@ def perm(localNameSpace, lines, lineNum, tokens) -> OpReturn:
         err.raiseFormattedError(err.pythonError(lines, lineNum, e))
 
     try:
-        g = funcWrapper( _gate, lines, lineNum, numQubits, [], 0, permGate )
+        val = funcWrapper( _gate, lines, lineNum, localNameSpace['state'], numQubits, [], 0, permGate )
 
     except Exception as e:
         err.raiseFormattedError(err.pythonError(lines, lineNum ,e))
 
-    if isinstance(g, ProbVal):
-        for i in range(len(g.values)):
-            g.values[i] = gates.applyGate(g.values[i], localNameSpace['state'])
-        val = g.toDensityMatrix()
-    elif isinstance(g, np.ndarray):
-        val = gates.applyGate(g, localNameSpace['state'])
-    else:
+    if isinstance(val, ProbVal):
+        val = val.toDensityMatrix()
+    elif not isinstance(val, np.ndarray):
         raise Exception("permGate is not array or ProbVal")
 
     setVal(localNameSpace, lines, lineNum, 'state', val, qset = True)
 
 
-def _swap(lines, lineNum, numQubits, qubitA, qubitB):
+def _swap(lines, lineNum, state, numQubits, qubitA, qubitB):
+    '''returns state with qubitA and qubitB swapped'''
     if qubitA < 0 or qubitA >= numQubits:
         err.raiseFormattedError(err.customIndexError(lines, lineNum, 'target', qubitA, numQubits - 1))
     if qubitB < 0 or qubitB >= numQubits:
         err.raiseFormattedError(err.customIndexError(lines, lineNum, 'target', qubitB, numQubits - 1))
 
-    return gates.genSwapGate(numQubits, qubitA, qubitB)
+    return gates.applyQubitPermutation(gates.genSwapPermutation(numQubits, qubitA, qubitB), state)
 
 def swap(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     numQubits = hilbertSpaceNumQubits(localNameSpace['state'])
@@ -377,35 +422,29 @@ def swap(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     assertProbValType(lines, lineNum, a, int)
     assertProbValType(lines, lineNum, b, int)
     try:
-        swapGate = funcWrapper( _swap, lines, lineNum, numQubits, a, b )
+        val = funcWrapper( _swap, lines, lineNum, localNameSpace['state'], numQubits, a, b )
     except Exception as e:
         err.raiseFormattedError(err.pythonError(lines, lineNum, e))
 
-    if isinstance(swapGate, ProbVal):
-        for i in range(len(swapGate.values)):
-            swapGate.values[i] = gates.applyGate(swapGate.values[i], localNameSpace['state'])
-        val = swapGate.toDensityMatrix()
-    elif isinstance(swapGate, np.ndarray):
-        val = gates.applyGate(swapGate, localNameSpace['state'])
-    else:
-        raise Exception("swapGate is not array or ProbVal")
+    if isinstance(val, ProbVal):
+        val = val.toDensityMatrix()
+    elif not isinstance(val, np.ndarray):
+        raise Exception("swapped state is not array or ProbVal")
 
     setVal(localNameSpace, lines, lineNum, 'state', val, qset = True)
 
 
-def meas(localNameSpace, lines, lineNum, tokens, changeState = True) -> OpReturn:
-    varName = getVarName(lines, lineNum, tokens[1])
-
-    measBasis = evaluateWrapper(lines, lineNum, tokens[2], localNameSpace)
+def _measure(localNameSpace, lines, lineNum, basisToken, targetsToken, changeState) -> MeasurementResult:
+    measBasis = evaluateWrapper(lines, lineNum, basisToken, localNameSpace)
     # TODO allow for probval basis
     if not isinstance(measBasis, basis.Basis):
         err.raiseFormattedError(err.customTypeError(lines, lineNum, ['Basis'], type(measBasis).__name__))
 
     try:
-        if len(tokens) < 4:
+        if targetsToken is None:
             result = measureArbitraryMultiState(localNameSpace['state'], measBasis, None, changeState)
         else:
-            targets = ensureContainer(lines, lineNum, evaluateWrapper(lines, lineNum, tokens[3], localNameSpace))
+            targets = ensureContainer(lines, lineNum, evaluateWrapper(lines, lineNum, targetsToken, localNameSpace))
 
             if isinstance(targets, ProbVal):
                 result = funcWrapper(measureArbitraryMultiState, localNameSpace['state'], measBasis, targets, changeState)
@@ -419,6 +458,12 @@ def meas(localNameSpace, lines, lineNum, tokens, changeState = True) -> OpReturn
 
     if isinstance(result, ProbVal):
         result = MeasurementResult.fromProbVal(result)
+    return result
+
+def meas(localNameSpace, lines, lineNum, tokens, changeState = True) -> OpReturn:
+    varName = getVarName(lines, lineNum, tokens[1])
+
+    result = _measure(localNameSpace, lines, lineNum, tokens[2], tokens[3] if len(tokens) > 3 else None, changeState)
 
     localNameSpace[varName] = result
     if changeState:
@@ -427,6 +472,22 @@ def meas(localNameSpace, lines, lineNum, tokens, changeState = True) -> OpReturn
 def peek(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     return meas(localNameSpace, lines, lineNum, tokens, changeState = False)
 
+def samp(localNameSpace, lines, lineNum, tokens) -> OpReturn:
+    varName = getVarName(lines, lineNum, tokens[1])
+
+    shots = evaluateWrapper(lines, lineNum, tokens[3], localNameSpace)
+    if isinstance(shots, ProbVal):
+        err.raiseFormattedError(err.customTypeError(lines, lineNum, ['int'], shots.typeString()))
+    # numpy integers are accepted, bools are not despite being ints
+    if not isinstance(shots, numbers.Integral) or isinstance(shots, bool):
+        err.raiseFormattedError(err.customTypeError(lines, lineNum, ['int'], type(shots).__name__))
+    shots = int(shots)
+    if shots < 0:
+        err.raiseFormattedError(err.pythonError(lines, lineNum, ValueError(f"number of shots {shots} must be non negative")))
+
+    result = _measure(localNameSpace, lines, lineNum, tokens[2], tokens[4] if len(tokens) > 4 else None, False)
+    localNameSpace[varName] = sampleMeasurement(result, shots, localNameSpace['__rng'])
+
 
 def cout(localNameSpace, lines, lineNum, tokens) -> OpReturn:
     print(evaluateWrapper(lines, lineNum, tokens[1], localNameSpace))
@@ -489,6 +550,7 @@ operations = {
     # Measurement
     'meas': (meas, 2, 3),
     'peek': (peek, 2, 3),
+    'samp': (samp, 3, 4),
 
     # Control Flow
     'jump': (jump, 1, 1),
@@ -505,3 +567,9 @@ operations = {
     # also includes note
 }
 
+# operations whose first argument is the name of the variable they define
+definingOperations = ('cdef', 'qdef', 'meas', 'peek', 'samp')
+
+# operations whose first argument is a mark name
+jumpOperations = ('jump', 'cjmp')
+
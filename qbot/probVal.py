@@ -1,8 +1,10 @@
 from typing import List, Tuple
 import math
 import operator
+from collections import Counter
 import numpy as np
 from typing import Callable, TypeVar, Union
+from qbot.density import ketEnsambleToDensity, densityEnsambleToDensity
 
 smallVal = 1e-5
 probRounding = 15
@@ -15,34 +17,313 @@ def valsClose(a, b):
     return a == b
 
 
+# decimals ndarray values are rounded to before hashing
+arrayRounding = 10
+
+def _floatKey(value):
+    '''floats are quantized to multiples of smallVal, integral floats share their key with the equivalent int'''
+    if not math.isfinite(value):
+        return ('float', repr(float(value)))
+    quantized = round(value / smallVal)
+    scale = round(1 / smallVal)
+    if quantized % scale == 0:
+        return quantized // scale
+    return ('float', quantized)
+
+def valueKey(value):
+    '''
+    hashable key for value, used by normalize to collapse duplicates in a single pass, values which are close share a key
+    raises TypeError for unhashable values without a canonical form
+    '''
+    if isinstance(value, (bool, int, np.integer, str)):
+        return value
+
+    if isinstance(value, (float, np.floating)):
+        return _floatKey(value)
+
+    if isinstance(value, (complex, np.complexfloating)):
+        imag = _floatKey(value.imag)
+        if imag == 0:
+            return _floatKey(value.real)
+        return ('complex', _floatKey(value.real), imag)
+
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in 'biufc':
+            # adding 0 turns -0.0 into 0.0 so they hash the same
+            rounded = np.round(value.astype(complex), arrayRounding) + 0
+            return ('ndarray', value.shape, rounded.tobytes())
+        return ('ndarray', value.shape, value.dtype.str, value.tobytes())
+
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(valueKey(item) for item in value))
+
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(valueKey(item) for item in value))
+
+    hash(value)
+    return value
+
+
+# types which can back a NumericProbVal (all values must share one of these exact types)
+numericTypes = (bool, int, float, complex)
+
+def _isNumeric(values) -> bool:
+    if len(values) == 0:
+        return False
+    t = type(values[0])
+    if t not in numericTypes:
+        return False
+    for value in values:
+        if type(value) is not t:
+            return False
+    return True
+
+
+def _isStackable(values) -> bool:
+    '''all values are numeric ndarrays of the same shape'''
+    if len(values) == 0 or not isinstance(values[0], np.ndarray):
+        return False
+    shape = values[0].shape
+    for value in values:
+        if not isinstance(value, np.ndarray) or value.shape != shape or value.dtype.kind not in 'biufc':
+            return False
+    return True
+
+
+
+class ApproximationPolicy:
+    '''
+    bounds the support of ProbVals, applied whenever a ProbVal is normalized
+    values with probability below minProb are always removed, then (each is optional)
+    numBins:          float values are merged into numBins equal width bins, at the probability weighted mean of each bin
+    topK:             only the topK most probable values are kept
+    maxDiscardedMass: the least probable values are removed while the removed mass stays within maxDiscardedMass
+    discardedMass accumulates the mass removed from every ProbVal (each as a fraction of that ProbVal's total)
+    '''
+    def __init__(self, topK: int = None, maxDiscardedMass: float = None, numBins: int = None, minProb: float = smallVal):
+        if topK is not None and topK < 1:
+            raise ValueError("topK must be at least 1")
+        if numBins is not None and numBins < 1:
+            raise ValueError("numBins must be at least 1")
+
+        self.topK = topK
+        self.maxDiscardedMass = maxDiscardedMass
+        self.numBins = numBins
+        self.minProb = minProb
+        self.discardedMass = 0.0
+
+    def bins(self, values: np.ndarray) -> bool:
+        '''whether binValues moves values'''
+        return self.numBins is not None and values.dtype.kind == 'f' and len(values) > self.numBins
+
+    def binValues(self, probs: np.ndarray, values: np.ndarray) -> np.ndarray:
+        '''moves float values to the probability weighted mean of their bin (merged by normalization afterwards)'''
+        if not self.bins(values):
+            return values
+
+        low = values.min()
+        high = values.max()
+        if not (np.isfinite(low) and np.isfinite(high)) or low == high:
+            return values
+
+        bins = np.minimum(((values - low) / (high - low) * self.numBins).astype(int), self.numBins - 1)
+        binMass = np.bincount(bins, weights = probs, minlength = self.numBins)
+        binSum = np.bincount(bins, weights = probs * values, minlength = self.numBins)
+        means = np.divide(binSum, binMass, out = np.zeros(self.numBins), where = binMass > 0)
+
+        # values in a bin without mass are left where they are
+        return np.where(binMass[bins] > 0, means[bins], values)
+
+    def prune(self, probs: np.ndarray) -> Tuple[np.ndarray, float]:
+        '''returns a mask of the values to keep and the fraction of mass discarded'''
+        keep = probs >= self.minProb
+
+        if self.topK is not None and np.count_nonzero(keep) > self.topK:
+            order = np.argsort(-np.where(keep, probs, -1), kind = 'stable')
+            keep[order[self.topK:]] = False
+
+        total = probs.sum()
+        if self.maxDiscardedMass is not None and total > 0:
+            # least probable first, the most probable value is always kept
+            candidates = np.flatnonzero(keep)
+            candidates = candidates[np.argsort(probs[candidates], kind = 'stable')][:-1]
+            discarded = probs[~keep].sum() + np.cumsum(probs[candidates])
+            keep[candidates[discarded <= self.maxDiscardedMass * total]] = False
+
+        discardedMass = float(probs[~keep].sum() / total) if total > 0 else 0.0
+        self.discardedMass += discardedMass
+        return keep, discardedMass
+
+    def __repr__(self):
+        return f"ApproximationPolicy(topK = {self.topK}, maxDiscardedMass = {self.maxDiscardedMass}, numBins = {self.numBins}, minProb = {self.minProb}, discardedMass = {self.discardedMass})"
+
+
+approximationPolicy = ApproximationPolicy()
+
+def setApproximationPolicy(policy: ApproximationPolicy) -> ApproximationPolicy:
+    '''sets the policy used when normalizing ProbVals, returns the previous one'''
+    global approximationPolicy
+    previous = approximationPolicy
+    approximationPolicy = policy
+    return previous
+
+def approximate(topK: int = None, maxDiscardedMass: float = None, numBins: int = None, minProb: float = smallVal) -> ApproximationPolicy:
+    '''creates and sets an ApproximationPolicy, returns it so its discardedMass can be read'''
+    policy = ApproximationPolicy(topK, maxDiscardedMass, numBins, minProb)
+    setApproximationPolicy(policy)
+    return policy
+
+
+def _unwrap(value):
+    '''numpy scalars (0d arrays) as python values'''
+    if isinstance(value, np.ndarray) and value.ndim == 0:
+        return value.item()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class SampleSpace:
+    '''
+    outcomes which ProbVals are correlated through, ProbVals derived from the same ProbVal (by operators, map or
+    functions) share its sample space and hold their value for each of its outcomes
+    combining ProbVals of independent sample spaces gives a joint sample space, the product of their bases (the
+    independent sample spaces they are built from), so results stay correlated with both operands
+    operations between ProbVals combine them outcome by outcome over the joint of their sample spaces, rather than
+    treating them as independent
+    '''
+    def __init__(self, probs: np.ndarray, bases: tuple = None):
+        self.probs = probs
+        # outcomes of a joint sample space are every combination of outcomes of its bases, in C order
+        self.bases = (self,) if bases is None else bases
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(len(base.probs) for base in self.bases)
+
+# joint sample spaces are bounded, ProbVals which would need a larger one are combined as independent instead
+maxJointOutcomes = 2**16
+
+def _jointSpace(spaces: List[SampleSpace]) -> Tuple[SampleSpace, List[np.ndarray]]:
+    '''
+    sample space of spaces together and, for each space, the index of its outcome in each joint outcome
+    spaces sharing a base are correlated through it, the joint is None (as are the indices) if it would exceed
+    maxJointOutcomes
+    '''
+    positions = {}
+    bases = []
+    for space in spaces:
+        for base in space.bases:
+            if id(base) not in positions:
+                positions[id(base)] = len(bases)
+                bases.append(base)
+
+    joint = next((space for space in spaces if len(space.bases) == len(bases)), None)
+    if joint is None:
+        if math.prod(len(base.probs) for base in bases) > maxJointOutcomes:
+            return None, [None]*len(spaces)
+        probs = bases[0].probs
+        for base in bases[1:]:
+            probs = np.multiply.outer(probs, base.probs)
+        joint = SampleSpace(probs.reshape(-1), tuple(bases))
+    else:
+        positions = {id(base): i for i, base in enumerate(joint.bases)}
+
+    size = len(joint.probs)
+    baseIndices = None
+    indices = []
+    for space in spaces:
+        if space is joint:
+            indices.append(np.arange(size))
+            continue
+        if baseIndices is None:
+            baseIndices = np.unravel_index(np.arange(size), joint.shape)
+        axes = [baseIndices[positions[id(base)]] for base in space.bases]
+        indices.append(np.ravel_multi_index(axes, space.shape))
+    return joint, indices
+
+def _outcomeList(outcomes: Union[list, np.ndarray]) -> list:
+    if isinstance(outcomes, np.ndarray):
+        return outcomes.tolist()
+    return outcomes
+
+def _fromSampleSpace(space: SampleSpace, outcomes: Union[list, np.ndarray]):
+    '''
+    ProbVal of outcomes (a value for each outcome of space) which stays correlated with the rest of space
+    if the approximation policy pruned or binned outcomes, the ProbVal is its own sample space (of the values it kept)
+    instead, so its support stays bounded by the policy
+    '''
+    if isinstance(outcomes, np.ndarray):
+        pv = NumericProbVal.fromArrays(space.probs, outcomes)
+    else:
+        pv = ProbVal.fromUnzipped(space.probs.tolist(), outcomes)
+        # nested ProbVals are not a function of the outcome alone
+        if any(isinstance(outcome, ProbVal) for outcome in outcomes):
+            return pv
+
+    if not isinstance(pv, ProbVal):
+        return pv
+
+    if isinstance(pv, NumericProbVal) and pv._isArrayBacked() and not isinstance(outcomes, np.ndarray):
+        outcomes = np.array(outcomes)
+        # mixed types (i.e. 1 and 1.0) would not keep python semantics as an array, so pv becomes its own sample space
+        if outcomes.dtype != pv._values.dtype:
+            return pv
+
+    if pv.discardedMass > 0 or (isinstance(outcomes, np.ndarray) and approximationPolicy.bins(outcomes)):
+        return pv
+    pv._space = space
+    pv._outcomes = outcomes
+    return pv
+
+
 class ProbVal:
     probs: List[float]
     values: list
+    # fraction of mass removed when this ProbVal was normalized
+    discardedMass: float
+
+    def __new__(cls, probs = None, values = None):
+        '''ProbVals of numeric values are backed by arrays, see NumericProbVal and StackedProbVal'''
+        if cls is ProbVal and values is not None and _isNumeric(values):
+            cls = NumericProbVal
+        elif cls is ProbVal and values is not None and _isStackable(values):
+            cls = StackedProbVal
+        return super().__new__(cls)
 
     def normalize(self):
         '''
-        removes small probability values
-        collapses duplicates
+        collapses duplicates (accumulating their probabilities)
+        removes small probability values, and any others pruned by the approximation policy
         ensures sum of all probabilites is 1
         '''
 
-        i = 0
-        while i < len(self.probs):
-            # remove small probability values
-            if self.probs[i] < smallVal:
-                self.probs.pop(i)
-                self.values.pop(i)
-                continue
+        # maps value keys to indices in probs/values, unhashable values are only merged with themselves
+        indices = {}
+        probs = []
+        values = []
+        for prob, value in zip(self.probs, self.values):
+            try:
+                key = valueKey(value)
+            except TypeError:
+                key = ('id', id(value))
+
+            index = indices.get(key)
+            if index is None:
+                indices[key] = len(probs)
+                probs.append(prob)
+                values.append(value)
+            else:
+                probs[index] += prob
 
-            # remove duplicate values
-            j = i + 1
-            while j < len(self.probs):
-                if valsClose(self.values[i], self.values[j]):
-                    self.probs.pop(j)
-                    self.values.pop(j)
-                    continue
-                j+=1
-            i += 1
+        # remove small probability values (and any others the approximation policy prunes)
+        keep, self.discardedMass = approximationPolicy.prune(np.asarray(probs, dtype = float))
+        self.probs = []
+        self.values = []
+        for prob, value, kept in zip(probs, values, keep):
+            if not kept:
+                continue
+            self.probs.append(prob)
+            self.values.append(value)
 
         #normalize
         s = sum(self.probs)
@@ -98,13 +379,22 @@ class ProbVal:
 
     def toDensityMatrix(self) -> np.ndarray:
         if isinstance(self.instance(), np.ndarray):
-            sum = np.zeros(self.values[0].shape, dtype = complex)
+            values = self.values
+            if _isStackable(values):
+                stack = self.stack if isinstance(self, StackedProbVal) else np.stack(values)
+                if stack.ndim == 2:
+                    return ketEnsambleToDensity(self.probs, stack)
+                return densityEnsambleToDensity(self.probs, stack)
+
+            # kets mixed with density matrices
+            dim = values[0].shape[0]
+            sum = np.zeros((dim, dim), dtype = complex)
             for i,prob in enumerate(self.probs):
-                value = self.values[i]
+                value = values[i]
 
                 # convert ket to density matrix
                 if len(value.shape) == 1:
-                    value = np.outer(value, value)
+                    value = np.outer(value, value.conj())
 
                 sum += prob*value
             return sum
@@ -132,7 +422,15 @@ class ProbVal:
 
 
     def map(self, func):
-        return ProbVal.fromUnzipped(self.probs, [func(val) for val in self.values])
+        space, outcomes = self.sampleSpace()
+        return _fromSampleSpace(space, [func(val) for val in _outcomeList(outcomes)])
+
+    def sampleSpace(self) -> Tuple['SampleSpace', Union[list, np.ndarray]]:
+        '''(sample space, value of self for each of its outcomes), a ProbVal not derived from another is its own sample space'''
+        if getattr(self, '_space', None) is None:
+            self._space = SampleSpace(np.asarray(self.probs, dtype = float))
+            self._outcomes = self.values
+        return self._space, self._outcomes
 
     def typeString(self):
         inst = self.instance()
@@ -152,55 +450,145 @@ class ProbVal:
                 return None
         return inst
 
+    # statistics
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''(probs, values) as arrays, raises TypeError if values are not numeric (or arrays of numbers)'''
+        values = np.asarray(self.values)
+        if values.dtype.kind not in 'biufc':
+            raise TypeError(f"{self.typeString()} does not have numeric values")
+        return np.asarray(self.probs, dtype = float), values
+
+    def expectation(self):
+        '''probability weighted mean of the values (elementwise for array values)'''
+        probs, values = self._arrays()
+        return _unwrap(np.tensordot(probs, values, axes = 1))
+
+    def variance(self):
+        '''expectation of |value - expectation|^2 (elementwise for array values)'''
+        probs, values = self._arrays()
+        mean = np.tensordot(probs, values, axes = 1)
+        return _unwrap(np.tensordot(probs, np.abs(values - mean)**2, axes = 1))
+
+    def quantile(self, q):
+        '''smallest value whose cumulative probability is at least q, q may be a float or list of floats'''
+        probs, values = self._arrays()
+        if values.ndim != 1 or values.dtype.kind == 'c':
+            raise TypeError(f"quantile requires real values, not {self.typeString()}")
+
+        order = np.argsort(values, kind = 'stable')
+        cumulative = np.cumsum(probs[order])
+        # tolerance for probabilites rounded to probRounding
+        indices = np.searchsorted(cumulative, np.asarray(q) - smallVal**2)
+        return values[order][np.minimum(indices, len(values) - 1)].tolist()
+
+    def entropy(self, base: float = 2) -> float:
+        '''shannon entropy of the distribution (in bits by default)'''
+        probs = np.asarray(self.probs, dtype = float)
+        probs = probs[probs > 0]
+        # adding 0 turns -0.0 into 0.0
+        return float(-np.sum(probs * np.log(probs)) / np.log(base)) + 0
+
+    def histogram(self, bins = 10) -> Tuple[np.ndarray, np.ndarray]:
+        '''(probability in each bin, bin edges), bins is passed to np.histogram'''
+        probs, values = self._arrays()
+        if values.ndim != 1 or values.dtype.kind == 'c':
+            raise TypeError(f"histogram requires real values, not {self.typeString()}")
+        return np.histogram(values, bins = bins, weights = probs)
+
+    def sample(self, n: int, seed = None) -> list:
+        '''n values drawn at random, seed may be anything np.random.default_rng accepts (including a Generator)'''
+        rng = np.random.default_rng(seed)
+        indices = rng.choice(len(self.probs), size = n, p = np.asarray(self.probs, dtype = float))
+        values = self.values
+        return [values[i] for i in indices.tolist()]
+
     def __unary(self, unaryOp, *args):
-        newProbs = []
-        newVals = []
-        for i, val in enumerate(self.values):
-            newProbs.append(self.probs[i])
-            newVals.append(unaryOp(val, *args))
-        return ProbVal.fromUnzipped(newProbs, newVals)
+        if isinstance(self, ProbValExpr):
+            return ProbValExpr.fromOp(lambda value: unaryOp(value, *args), (self,))
+
+        if isinstance(self, NumericProbVal):
+            result = self._numericUnary(unaryOp, *args)
+            if result is not NotImplemented:
+                return result
+
+        space, outcomes = self.sampleSpace()
+        return _fromSampleSpace(space, [unaryOp(val, *args) for val in _outcomeList(outcomes)])
 
     def __comparison(self, other, compareOp):
+        if isinstance(self, ProbValExpr) or isinstance(other, ProbValExpr):
+            return ProbValExpr.fromOp(lambda a, b: _compare(compareOp, a, b), (self, other))
+
+        if isinstance(self, NumericProbVal):
+            result = self._numericComparison(other, compareOp)
+            if result is not NotImplemented:
+                return result
+
+        space, outcomes = self.sampleSpace()
+        outcomes = _outcomeList(outcomes)
+
+        if not isinstance(other, ProbVal):
+            return _fromSampleSpace(space, [bool(compareOp(value, other)) for value in outcomes])
+
+        otherSpace, otherOutcomes = other.sampleSpace()
+        otherOutcomes = _outcomeList(otherOutcomes)
+
+        # correlated, compare outcome by outcome
+        if otherSpace is space:
+            return _fromSampleSpace(space, [bool(compareOp(a, b)) for a, b in zip(outcomes, otherOutcomes)])
+
+        joint, (indices, otherIndices) = _jointSpace([space, otherSpace])
+        if joint is not None:
+            return _fromSampleSpace(joint, [
+                bool(compareOp(outcomes[i], otherOutcomes[j])) for i, j in zip(indices.tolist(), otherIndices.tolist())
+            ])
+
         trueProb = 0
         falseProb = 0
-        if isinstance(other,ProbVal):
-            for i, prob1 in enumerate(self.probs):
-                value1 = self.values[i]
-                for j,prob2, in enumerate(other.probs):
-                    value2 = other.values[j]
-                    if compareOp(value1, value2):
-                        trueProb += prob1 * prob2
-                    else:
-                        falseProb += prob1 * prob2
-        else:
-            for i, prob, in enumerate(self.probs):
-                value = self.values[i]
-                if compareOp(value, other):
-                    trueProb += prob
+        for prob1, value1 in zip(space.probs.tolist(), outcomes):
+            for prob2, value2 in zip(otherSpace.probs.tolist(), otherOutcomes):
+                if compareOp(value1, value2):
+                    trueProb += prob1 * prob2
                 else:
-                    falseProb += prob
+                    falseProb += prob1 * prob2
         return ProbVal.fromUnzipped([trueProb, falseProb], [True, False])
 
     def __binary(self, other, binaryOp, reversed:bool):
+        if isinstance(self, ProbValExpr) or isinstance(other, ProbValExpr):
+            return ProbValExpr.fromOp(binaryOp, (other, self) if reversed else (self, other))
+
+        if isinstance(self, NumericProbVal):
+            result = self._numericBinary(other, binaryOp, reversed)
+            if result is not NotImplemented:
+                return result
+
+        space, outcomes = self.sampleSpace()
+        outcomes = _outcomeList(outcomes)
+
+        if not isinstance(other, ProbVal):
+            if reversed:
+                return _fromSampleSpace(space, [binaryOp(other, value) for value in outcomes])
+            return _fromSampleSpace(space, [binaryOp(value, other) for value in outcomes])
+
+        # reversed only occurs when other is not a ProbVal
+        otherSpace, otherOutcomes = other.sampleSpace()
+        otherOutcomes = _outcomeList(otherOutcomes)
+
+        # correlated, combine outcome by outcome
+        if otherSpace is space:
+            return _fromSampleSpace(space, [binaryOp(a, b) for a, b in zip(outcomes, otherOutcomes)])
+
+        joint, (indices, otherIndices) = _jointSpace([space, otherSpace])
+        if joint is not None:
+            return _fromSampleSpace(joint, [
+                binaryOp(outcomes[i], otherOutcomes[j]) for i, j in zip(indices.tolist(), otherIndices.tolist())
+            ])
+
         newProbs = []
         newVals = []
-        if isinstance(other,ProbVal):
-            for i, prob1 in enumerate(self.probs):
-                value1 = self.values[i]
-                for j,prob2, in enumerate(other.probs):
-                    value2 = other.values[j]
-                    if reversed:
-                        newVals.append(binaryOp(value1, value2))
-                    else:
-                        newVals.append(binaryOp(value2, value1))
-                    newProbs.append(prob1 * prob2)
-        else:
-            for i, prob, in enumerate(self.probs):
-                newProbs.append(prob)
-                if reversed:
-                    newVals.append(binaryOp(other, self.values[i]))
-                else:
-                    newVals.append(binaryOp(self.values[i], other))
+        for prob1, value1 in zip(space.probs.tolist(), outcomes):
+            for prob2, value2 in zip(otherSpace.probs.tolist(), otherOutcomes):
+                newVals.append(binaryOp(value1, value2))
+                newProbs.append(prob1 * prob2)
 
         return ProbVal.fromUnzipped(newProbs, newVals)
 
@@ -343,49 +731,487 @@ class ProbVal:
         return self.__matmul__(other, reversed = True)
 
 
-T = TypeVar('T')
-def funcWrapper(func: Callable[...,T], *args, **kwargs) -> Union[ProbVal, T]:
-    '''wrapper for functions, makes them probabilistic (ProbVal inputs and return)'''
-    probs = []
-    vals = []
+# operations NumericProbVal vectorizes, all others fall back to the list form
+vectorizedUnaryOps = (operator.neg, operator.pos, operator.abs, operator.inv)
+vectorizedBinaryOps = (operator.add, operator.sub, operator.mul, operator.truediv, operator.floordiv, operator.mod, operator.rshift)
+vectorizedComparisonOps = (operator.eq, operator.ne, operator.gt, operator.lt, operator.ge, operator.le, operator.and_, operator.or_, operator.xor)
+
+# bound on integer operands which keeps int64 results exact (matching python ints)
+maxVectorizedInt = 2**31
+
+def _arithmeticOperand(a: np.ndarray) -> np.ndarray:
+    '''bools behave as ints in python arithmetic'''
+    if a.dtype.kind == 'b':
+        return a.astype(np.int64)
+    return a
+
+def _vectorizable(a: np.ndarray, b: np.ndarray, binaryOp) -> bool:
+    '''false where numpy would differ from python (division by zero, int overflow, invalid operand types)'''
+    if binaryOp in (operator.truediv, operator.floordiv, operator.mod) and np.any(b == 0):
+        return False
+
+    isInt = a.dtype.kind in 'iu' and b.dtype.kind in 'iu'
+    if binaryOp is operator.rshift:
+        return isInt and np.all(b >= 0)
+
+    if binaryOp in (operator.floordiv, operator.mod) and (a.dtype.kind == 'c' or b.dtype.kind == 'c'):
+        return False
+
+    if isInt:
+        return max(int(np.abs(a).max()), int(np.abs(b).max())) < maxVectorizedInt
+
+    return True
 
-    numLoop = 1
 
-    for arg in args:
-        if isinstance(arg, ProbVal):
-            numLoop *= len(arg.probs)
+class NumericProbVal(ProbVal):
+    '''
+    ProbVal whose values are all bool, int, float or complex (of the same type), backed by numpy arrays so arithmetic
+    and comparisons are vectorized, probs and values are still available as lists
+    '''
+    def __init__(self, probs: List[float], values: list):
+        if len(probs) != len(values):
+            raise Exception("len of probs and values must be the same")
+
+        try:
+            arrayValues = np.array(values)
+        except OverflowError:
+            arrayValues = np.array(values, dtype = object)
+
+        # python ints too large for int64
+        if arrayValues.dtype.kind not in 'biufc':
+            ProbVal.__init__(self, probs, values)
+            return
+
+        self.setArrays(np.asarray(probs, dtype = float), arrayValues)
+
+    @staticmethod
+    def fromArrays(probs: np.ndarray, values: np.ndarray):
+        '''builds a NumericProbVal from arrays, returns the value itself if there is only one'''
+        pv = object.__new__(NumericProbVal)
+        pv.setArrays(probs, values)
+        if len(pv.probs) == 1:
+            return pv.values[0]
+        return pv
+
+    def setArrays(self, probs: np.ndarray, values: np.ndarray):
+        '''vectorized equivalent of ProbVal.normalize, keys match valueKey'''
+        values = approximationPolicy.binValues(probs, values)
+
+        if values.dtype.kind == 'f':
+            keys = np.round(values / smallVal)
+        elif values.dtype.kind == 'c':
+            keys = np.stack([np.round(values.real / smallVal), np.round(values.imag / smallVal)], axis = 1)
+        else:
+            keys = values
 
-    for _, value in kwargs:
+        # axis is only given for complex keys, as unique is much slower with it
+        axis = 0 if keys.ndim == 2 else None
+        _, firstIndex, inverse = np.unique(keys, return_index = True, return_inverse = True, axis = axis)
+        merged = np.bincount(inverse.reshape(-1), weights = probs, minlength = len(firstIndex))
+
+        # keep values in order of first occurrence, as the list form does
+        order = np.argsort(firstIndex, kind = 'stable')
+        merged = merged[order]
+        values = values[firstIndex[order]]
+
+        keep, self.discardedMass = approximationPolicy.prune(merged)
+        merged = merged[keep]
+
+        self._probs = np.round(merged / merged.sum(), probRounding)
+        self._values = values[keep]
+        self._probsList = None
+        self._valuesList = None
+
+    def normalize(self):
+        if hasattr(self, '_probs'):
+            self.setArrays(self._probs, self._values)
+        else:
+            ProbVal.normalize(self)
+
+    @property
+    def probs(self) -> List[float]:
+        if self._probsList is None:
+            self._probsList = self._probs.tolist()
+        return self._probsList
+
+    @probs.setter
+    def probs(self, probs):
+        # list form fallback (see __init__)
+        self._probsList = probs
+
+    @property
+    def values(self) -> list:
+        if self._valuesList is None:
+            self._valuesList = self._values.tolist()
+        return self._valuesList
+
+    @values.setter
+    def values(self, values):
+        self._valuesList = values
+
+    def _isArrayBacked(self) -> bool:
+        return hasattr(self, '_probs')
+
+    def sampleSpace(self) -> Tuple[SampleSpace, Union[list, np.ndarray]]:
+        if not self._isArrayBacked():
+            return ProbVal.sampleSpace(self)
+        if getattr(self, '_space', None) is None:
+            self._space = SampleSpace(self._probs)
+            self._outcomes = self._values
+        return self._space, self._outcomes
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._isArrayBacked():
+            return ProbVal._arrays(self)
+        return self._probs, self._values
+
+    def _numericOperand(self, other):
+        '''
+        (a, b, probs, space) with a the outcomes of self and b those of other over their joint sample space,
+        space is None if the joint is too large (a and b are then broadcast against each other as independent),
+        or None if other cannot be vectorized
+        '''
+        space, outcomes = self.sampleSpace()
+        if isinstance(other, NumericProbVal) and other._isArrayBacked():
+            otherSpace, otherOutcomes = other.sampleSpace()
+            if otherSpace is space:
+                return outcomes, otherOutcomes, space.probs, space
+            joint, (indices, otherIndices) = _jointSpace([space, otherSpace])
+            if joint is not None:
+                return outcomes[indices], otherOutcomes[otherIndices], joint.probs, joint
+            return outcomes[:, None], otherOutcomes[None, :], np.outer(space.probs, otherSpace.probs), None
+        if type(other) in numericTypes:
+            return outcomes, np.asarray(other), space.probs, space
+        return None
+
+    def _numericUnary(self, unaryOp, *args):
+        if not self._isArrayBacked() or unaryOp not in vectorizedUnaryOps or len(args) != 0:
+            return NotImplemented
+
+        space, outcomes = self.sampleSpace()
+        values = _arithmeticOperand(outcomes)
+        if unaryOp is operator.inv and values.dtype.kind not in 'iu':
+            return NotImplemented
+        return _fromSampleSpace(space, unaryOp(values))
+
+    def _numericBinary(self, other, binaryOp, reversed: bool):
+        if not self._isArrayBacked() or binaryOp not in vectorizedBinaryOps:
+            return NotImplemented
+
+        operand = self._numericOperand(other)
+        if operand is None:
+            return NotImplemented
+        a, b, probs, space = operand
+
+        a = _arithmeticOperand(a)
+        b = _arithmeticOperand(b)
+        if reversed:
+            a, b = b, a
+
+        if not _vectorizable(a, b, binaryOp):
+            return NotImplemented
+
+        if space is not None:
+            return _fromSampleSpace(space, binaryOp(a, b))
+        return NumericProbVal.fromArrays(probs.reshape(-1), binaryOp(a, b).reshape(-1))
+
+    def _numericComparison(self, other, compareOp):
+        if not self._isArrayBacked() or compareOp not in vectorizedComparisonOps:
+            return NotImplemented
+
+        operand = self._numericOperand(other)
+        if operand is None:
+            return NotImplemented
+        a, b, probs, space = operand
+        kinds = {a.dtype.kind, b.dtype.kind}
+
+        # python raises for these, leave that to the list form
+        if compareOp in (operator.and_, operator.or_, operator.xor) and not kinds <= set('biu'):
+            return NotImplemented
+        if compareOp in (operator.gt, operator.lt, operator.ge, operator.le) and 'c' in kinds:
+            return NotImplemented
+
+        mask = compareOp(a, b).astype(bool)
+        if space is not None:
+            return _fromSampleSpace(space, mask)
+
+        trueProb = float(probs[mask].sum())
+        falseProb = float(probs[~mask].sum())
+        return ProbVal.fromUnzipped([trueProb, falseProb], [True, False])
+
+
+class StackedProbVal(ProbVal):
+    '''
+    ProbVal whose values are all numeric ndarrays of the same shape (i.e. kets, density matrices or gates), stored as
+    one stacked (m, ...) array with the values being views into it
+    '''
+    stack: np.ndarray
+
+    def normalize(self):
+        ProbVal.normalize(self)
+        if len(self.values) == 0:
+            self.stack = np.array([])
+            return
+        self.stack = np.stack(self.values)
+        self.values = list(self.stack)
+
+
+def _compare(compareOp, a, b):
+    '''comparison as done by ProbVal, a ProbVal of bools if either side is a ProbVal'''
+    if isinstance(a, ProbVal) or isinstance(b, ProbVal):
+        return compareOp(a, b)
+    return bool(compareOp(a, b))
+
+def _mix(space: SampleSpace, values: list):
+    '''values for each outcome of space, nested ProbVals are flattened first (so numeric results stay array backed)'''
+    if not any(isinstance(value, ProbVal) for value in values):
+        return _fromSampleSpace(space, values)
+
+    flatProbs = []
+    flatValues = []
+    for prob, value in zip(space.probs.tolist(), values):
         if isinstance(value, ProbVal):
-            numLoop *= len(value.probs)
+            flatProbs.extend(prob*subProb for subProb in value.probs)
+            flatValues.extend(value.values)
+        else:
+            flatProbs.append(prob)
+            flatValues.append(value)
+    return ProbVal.fromUnzipped(flatProbs, flatValues)
+
+def _evaluateLeaf(leaf: 'ProbValExpr', bindings: dict):
+    '''value of leaf given the bases of its sample space which are bound, a ProbVal over the rest if not all are'''
+    space = leaf._leafSpace
+    bound = [bindings.get(id(base)) for base in space.bases]
+    if all(index is None for index in bound):
+        return leaf._leaf
+    if all(index is not None for index in bound):
+        return leaf._leafOutcomes[int(np.ravel_multi_index(bound, space.shape))]
+
+    # outcomes of the unbound bases, which stay correlated with them
+    index = tuple(slice(None) if i is None else i for i in bound)
+    outcomes = np.arange(len(space.probs)).reshape(space.shape)[index].reshape(-1).tolist()
+    freeSpace, _ = _jointSpace([base for base, i in zip(space.bases, bound) if i is None])
+    return _fromSampleSpace(freeSpace, [leaf._leafOutcomes[outcome] for outcome in outcomes])
+
+def _evaluate(node, bindings: dict):
+    '''
+    evaluates an expression graph, bindings maps the ids of base sample spaces (see SampleSpace) to the index of the
+    outcome they are conditioned on
+    returns a ProbVal or a deterministic value
+    '''
+    if not isinstance(node, ProbValExpr):
+        return node
+
+    if node._leaf is not None:
+        return _evaluateLeaf(node, bindings)
+
+    free = {spaceId: count for spaceId, count in node._occurrences.items() if spaceId not in bindings}
+
+    if len(free) == 0:
+        return node._op(*[_evaluate(arg, bindings) for arg in node._args])
+
+    if len(free) == 1:
+        (spaceId, count), = free.items()
+        space, leaf = node._leaves[spaceId]
+
+        # a chain over one sample space is fused, every operation is applied per outcome and merged once at the end
+        # (array backed ProbVals used once are left to the vectorized operators)
+        if count > 1 or not isinstance(leaf, NumericProbVal):
+            values = [_evaluate(node, {**bindings, spaceId: i}) for i in range(len(space.probs))]
+            return _mix(space, values)
+
+    # sample spaces used by more than one argument make them correlated
+    argSpaces = [
+        {spaceId for spaceId in arg._occurrences if spaceId not in bindings}
+        for arg in node._args if isinstance(arg, ProbValExpr)
+    ]
+    counts = Counter(spaceId for spaces in argSpaces for spaceId in spaces)
+    shared = [spaceId for spaceId, count in counts.items() if count > 1]
+
+    if len(shared) == 0:
+        # independent arguments are evaluated (and merged) before being combined
+        return node._op(*[_evaluate(arg, bindings) for arg in node._args])
+
+    # condition on a shared sample space, repeated until the arguments are independent
+    spaceId = shared[0]
+    space, _ = node._leaves[spaceId]
+    values = [_evaluate(node, {**bindings, spaceId: i}) for i in range(len(space.probs))]
+    return _mix(space, values)
+
+
+class ProbValExpr(ProbVal):
+    '''
+    deferred ProbVal, operators build an expression graph instead of expanding every combination of values
+    the graph is evaluated when the value is observed (probs/values are read, or it is passed to an operation)
+    ProbVals of the same sample space refer to the same outcome throughout the expression
+    '''
+
+    def __new__(cls, op = None, args = (), leaf = None):
+        return object.__new__(cls)
+
+    def __init__(self, op: Callable, args: tuple, leaf: ProbVal = None):
+        self._op = op
+        self._args = args
+        self._leaf = leaf
+        self._result = None
+        self._evaluated = False
+
+        # base sample spaces the expression depends on (by id, with a ProbVal of each), and how many times each is used
+        if leaf is not None:
+            self._leafSpace, outcomes = leaf.sampleSpace()
+            self._leafOutcomes = _outcomeList(outcomes)
+            self._leaves = {id(base): (base, leaf) for base in self._leafSpace.bases}
+            self._occurrences = Counter(self._leaves.keys())
+            return
+
+        self._leaves = {}
+        self._occurrences = Counter()
+        for arg in args:
+            if isinstance(arg, ProbValExpr):
+                self._leaves.update(arg._leaves)
+                self._occurrences.update(arg._occurrences)
+
+    @staticmethod
+    def fromOp(op: Callable, args: tuple):
+        args = tuple(defer(arg) if isinstance(arg, ProbVal) else arg for arg in args)
+        return ProbValExpr(op, args)
+
+    def evaluate(self):
+        '''returns the ProbVal (or value if deterministic) the expression evaluates to'''
+        if not self._evaluated:
+            self._result = _evaluate(self, {})
+            self._evaluated = True
+        return self._result
+
+    @property
+    def probs(self) -> List[float]:
+        result = self.evaluate()
+        return result.probs if isinstance(result, ProbVal) else [1.0]
+
+    @property
+    def values(self) -> list:
+        result = self.evaluate()
+        return result.values if isinstance(result, ProbVal) else [result]
+
+    @property
+    def discardedMass(self) -> float:
+        result = self.evaluate()
+        return result.discardedMass if isinstance(result, ProbVal) else 0.0
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        result = self.evaluate()
+        if isinstance(result, ProbVal):
+            return result._arrays()
+        return ProbVal([1.0], [result])._arrays()
+
+    def sampleSpace(self) -> Tuple[SampleSpace, Union[list, np.ndarray]]:
+        result = self.evaluate()
+        if isinstance(result, ProbVal):
+            return result.sampleSpace()
+        return SampleSpace(np.ones(1)), [result]
+
+    def __str__(self):
+        return str(self.evaluate())
+
+
+def defer(value):
+    '''defers operations on a ProbVal, see ProbValExpr'''
+    if isinstance(value, ProbValExpr) or not isinstance(value, ProbVal):
+        return value
+    return ProbValExpr(None, (), leaf = value)
+
+def observe(value):
+    '''evaluates deferred ProbVals, other values are returned as is'''
+    if isinstance(value, ProbValExpr):
+        return value.evaluate()
+    return value
+
+
+# statistics for ProbVals and deterministic values (which have all their probability on one value)
+def _asProbVal(value) -> ProbVal:
+    if isinstance(value, ProbVal):
+        return value
+    return ProbVal([1.0], [value])
+
+def expectation(value):
+    return _asProbVal(value).expectation()
+
+def variance(value):
+    return _asProbVal(value).variance()
+
+def quantile(value, q):
+    return _asProbVal(value).quantile(q)
+
+def entropy(value, base: float = 2) -> float:
+    return _asProbVal(value).entropy(base)
 
+def histogram(value, bins = 10) -> Tuple[np.ndarray, np.ndarray]:
+    return _asProbVal(value).histogram(bins)
 
-    argPermutation = len(args)*[None]
+def sample(value, n: int, seed = None) -> list:
+    return _asProbVal(value).sample(n, seed)
+
+
+T = TypeVar('T')
+def funcWrapper(func: Callable[...,T], *args, **kwargs) -> Union[ProbVal, T]:
+    '''wrapper for functions, makes them probabilistic (ProbVal inputs and return)'''
+
+    # (position or key, ProbVal) of every probabilistic argument
+    probValArgs = [(i, arg) for i, arg in enumerate(args) if isinstance(arg, ProbVal)]
+    probValArgs.extend((key, value) for key, value in kwargs.items() if isinstance(value, ProbVal))
+
+    # deterministic fast path
+    if len(probValArgs) == 0:
+        return func(*args, **kwargs)
+
+    # ProbVals are correlated through their sample spaces, so func is evaluated for each outcome of their joint
+    spaces = []
+    argOutcomes = []
+    for _, pv in probValArgs:
+        space, outcomes = pv.sampleSpace()
+        spaceIndex = next((i for i, other in enumerate(spaces) if other is space), None)
+        if spaceIndex is None:
+            spaceIndex = len(spaces)
+            spaces.append(space)
+        argOutcomes.append((spaceIndex, _outcomeList(outcomes)))
+
+    argPermutation = list(args)
     kwargPermutation = {**kwargs}
-    for i in range(0, numLoop):
-        remainder = i
-        prob = 1
-        for i,arg in enumerate(args):
-            if isinstance(arg, ProbVal):
-                index = remainder % len(arg.probs)
-                remainder //= len(arg.probs)
-                prob *= arg.probs[index]
-                argPermutation[i] = arg.values[index]
-            else:
-                argPermutation[i] = arg
 
-        for i, item in enumerate(kwargs.items()):
-            key, value = item
-            if isinstance(value, ProbVal):
-                index = remainder % len(value.probs)
-                remainder //= len(value.probs)
-                prob *= value.probs[index]
-                kwargPermutation[key] = value.values[index]
+    # reversed so the first sample space varies fastest
+    joint, indices = _jointSpace(spaces[::-1])
+    if joint is not None:
+        indices = [spaceIndices.tolist() for spaceIndices in indices[::-1]]
+        vals = []
+        for outcome in range(len(joint.probs)):
+            for (slot, _), (spaceIndex, outcomes) in zip(probValArgs, argOutcomes):
+                if isinstance(slot, int):
+                    argPermutation[slot] = outcomes[indices[spaceIndex][outcome]]
+                else:
+                    kwargPermutation[slot] = outcomes[indices[spaceIndex][outcome]]
+
+            vals.append(func(*argPermutation, **kwargPermutation))
+        return _fromSampleSpace(joint, vals)
+
+    # too many outcomes to keep correlated, every combination of outcomes of the sample spaces is evaluated as
+    # independent, first sample space varies fastest
+    shape = tuple(len(space.probs) for space in spaces)
+    combinations = np.indices(shape).reshape(len(shape), -1, order = 'F').T.tolist()
+
+    vals = []
+    for combination in combinations:
+        for (slot, _), (spaceIndex, outcomes) in zip(probValArgs, argOutcomes):
+            if isinstance(slot, int):
+                argPermutation[slot] = outcomes[combination[spaceIndex]]
             else:
-                kwargPermutation[key] = value
+                kwargPermutation[slot] = outcomes[combination[spaceIndex]]
 
-        probs.append(prob)
         vals.append(func(*argPermutation, **kwargPermutation))
 
-    return ProbVal.fromUnzipped(probs, vals)
+    probs = spaces[0].probs
+    for space in spaces[1:]:
+        probs = np.multiply.outer(probs, space.probs)
+    probs = probs.reshape(-1, order = 'F')
+
+    return ProbVal.fromUnzipped(probs.tolist(), vals)
 
@@ -1,6 +1,99 @@
+import hashlib
+from collections import OrderedDict
+from functools import wraps
 import numpy as np
 from qbot.helpers import ensureSquare, log2, nthRootsOfUnity
 from typing import Callable
+from qbot.density import ketEnsambleToDensity
+
+
+class GateCache:
+    '''
+    LRU cache of generated gates keyed by generator and arguments, bounded by the total bytes of the cached gates,
+    cached gates are read only so the cached copy cannot be modified (see _cachedGate)
+    '''
+    def __init__(self, maxBytes: int = 64 * 2**20):
+        self.maxBytes = maxBytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, generate: Callable[[], np.ndarray]) -> np.ndarray:
+        '''returns the gate cached under key, calling generate if it is not cached'''
+        gate = self._entries.get(key)
+        if gate is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return gate
+
+        self.misses += 1
+        gate = generate()
+
+        # gates larger than the whole budget are returned without being cached
+        if gate.nbytes > self.maxBytes:
+            return gate
+
+        gate.flags.writeable = False
+        self._entries[key] = gate
+        self.bytes += gate.nbytes
+
+        while self.bytes > self.maxBytes:
+            _, evicted = self._entries.popitem(last = False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+        return gate
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'bytes': self.bytes,
+            'maxBytes': self.maxBytes,
+        }
+
+gateCache = GateCache()
+
+
+def _argKey(arg):
+    '''hashable key for a generator argument, arrays are keyed by shape, dtype and a hash of their contents'''
+    if isinstance(arg, np.ndarray):
+        digest = hashlib.blake2b(np.ascontiguousarray(arg).tobytes(), digest_size = 16).digest()
+        return (arg.shape, arg.dtype.str, digest)
+    if isinstance(arg, (list, tuple)):
+        return tuple(_argKey(a) for a in arg)
+    return arg
+
+
+def _cachedGate(generator: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+    '''
+    caches the gates returned by generator in gateCache, callers get a copy so they are free to modify it
+    calls with unhashable or callable arguments are not cached, as a function may depend on state outside of it
+    '''
+    @wraps(generator)
+    def cachedGenerator(*args, **kwargs):
+        if any(callable(arg) for arg in args) or any(callable(arg) for arg in kwargs.values()):
+            return generator(*args, **kwargs)
+
+        key = (generator.__name__, _argKey(args), _argKey(tuple(sorted(kwargs.items()))))
+        try:
+            hash(key)
+        except TypeError:
+            return generator(*args, **kwargs)
+
+        return gateCache.get(key, lambda: generator(*args, **kwargs)).copy()
+
+    return cachedGenerator
 
 
 def _checkGate(gate: np.ndarray):
@@ -23,18 +116,18 @@ def genSimonsGate(numQubits, f: Callable):
     '''
     unitary for the blackbox function described in simon's algorithm
     U_f: |x>|b> -> |x>|b addmod2 f(x)>
+    f is evaluated once over all x (see genArbitraryPermutation)
     '''
     size = 2**numQubits
-    arr = np.zeros((size,size), dtype = complex)
-    for i in range(size):
-        x = i // 2
-        b = i % 2
-        index = (x<<1) + (f(x) + b)%2
-        arr[i][index] = 1
+    fx = genArbitraryPermutation(size // 2, f)
 
-    return arr
+    i = np.arange(size)
+    x = i >> 1
+    b = i & 1
+    return _permutationToGate((x << 1) + (fx[x] + b) % 2)
 
 
+@_cachedGate
 def genXRotGate(theta):
     stheta = np.sin(theta/2)
     ctheta = np.cos(theta/2)
@@ -44,6 +137,7 @@ def genXRotGate(theta):
     ], dtype = complex)
 
 
+@_cachedGate
 def genYRotGate(theta):
     stheta = np.sin(theta/2)
     ctheta = np.cos(theta/2)
@@ -53,6 +147,7 @@ def genYRotGate(theta):
     ], dtype = complex)
 
 
+@_cachedGate
 def genZRotGate(theta):
     return np.array([
         [np.exp(-1j*theta/2), 0              ],
@@ -60,87 +155,105 @@ def genZRotGate(theta):
     ], dtype = complex)
 
 
+@_cachedGate
 def genQFT(numQubits):
     assert isinstance(numQubits, int)
     size = 2**numQubits
     unityDiv = nthRootsOfUnity(size) / np.sqrt(size)
-    qft = np.ones((size,size), dtype = complex)
-    for i in range(0, size):
-        for j in range(i, size):
-            index = (i*j)%size
-            qft[i][j] = unityDiv[index]
-            qft[j][i] = unityDiv[index]
 
-    return qft
+    # entry i, j is the (i*j)th root of unity
+    indices = np.arange(size)
+    return unityDiv[np.outer(indices, indices) % size]
 
 
-def genSwapGate(numQubits, q1, q2):
-    if (q1 == q2):
-        return np.eye(2**numQubits)
+def genQubitPermutation(numQubits: int, qubitOrder: list[int]) -> np.ndarray:
+    '''
+    index permutation for reordering qubits, qubit i of the new state is qubit qubitOrder[i] of the old state
+    returned array maps new state indices to old state indices
+    '''
+    return np.arange(2**numQubits).reshape((2,)*numQubits).transpose(qubitOrder).reshape(-1)
+
+
+def genSwapPermutation(numQubits: int, q1: int, q2: int) -> list[int]:
+    '''qubit order which swaps q1 and q2, to be used with applyQubitPermutation'''
+    if(max(q1, q2) >= numQubits):
+        raise Exception("genSwapPermutation Requires numQubits > q2 and q1")
 
-    if(q1 > q2):
-        q1, q2 = q2, q1
+    qubitOrder = list(range(numQubits))
+    qubitOrder[q1], qubitOrder[q2] = qubitOrder[q2], qubitOrder[q1]
+    return qubitOrder
 
-    if(q2 >= numQubits ):
-        raise Exception("getSwapGate Requires numQubits > q2 and q1")
 
-    # n and m in binary are bitmasks which represent the bits being flipped
-    # ie) numQubits = 4, q1 = 1 has n = 0100
-    n = 2**(numQubits - q1 - 1)
-    m = 2**(numQubits - q2 - 1)
+def genShiftPermutation(numQubits: int, up: bool, numShifts = 1) -> list[int]:
+    '''qubit order which shifts rails up or down with wrapping, see genShiftGate'''
+    return np.roll(np.arange(numQubits), -numShifts if up else numShifts).tolist()
 
-    gaps = [0]
-    for i in range(0,numQubits):
-        if(2**i != n and 2**i != m):
-            gaps.append(2**i)
 
-    start = m
-    size = n - m
+def genArbitraryPermutation(hilbertDim: int, stateMap: Callable) -> np.ndarray:
+    '''
+    evaluates stateMap once over all states, returns array where entry i is the state i is mapped to
+    stateMap is called on np.arange directly if it supports arrays, otherwise it is called per state
+    '''
+    states = np.arange(hilbertDim)
+    try:
+        permutation = np.asarray(stateMap(states), dtype = int)
+        if permutation.shape == states.shape:
+            return permutation
+    except Exception:
+        pass
+
+    return np.fromiter((stateMap(state) for state in range(hilbertDim)), dtype = int, count = hilbertDim)
 
-    swapStarts = [start]
-    swapEnds = [start+size]
 
-    for i,gap1 in enumerate(gaps):
-        for j in range(0,i):
-            gap2 = gaps[j]
-            swapStarts.append(start+ gap1 + gap2)
-            swapEnds.append(start + size + gap1 +gap2)
+def applyPermutation(permutation: np.ndarray, state: np.ndarray) -> np.ndarray:
+    '''
+    applies genArbitrarySwap(len(permutation), stateMap) to state (ket or density matrix) by indexing rather than matmul,
+    where permutation = genArbitraryPermutation(len(permutation), stateMap)
+    '''
+    inverse = np.empty_like(permutation)
+    inverse[permutation] = np.arange(permutation.shape[0])
 
-    swapStartIndex = 0
-    swapEndIndex = 0
-    swapGate = np.zeros((2**numQubits,2**numQubits),dtype = complex)
-    for i in range(0,2**numQubits):
-        if swapStartIndex < len(swapStarts) and i == swapStarts[swapStartIndex]:
-            swapStart = swapStarts[swapStartIndex]
-            swapEnd = swapEnds[swapStartIndex]
+    if state.ndim == 1:
+        return state[inverse]
+    return state[np.ix_(inverse, inverse)]
 
-            swapGate[ swapStart ][ swapEnd ] = 1
 
-            swapStartIndex += 1
+def applyQubitPermutation(qubitOrder: list[int], state: np.ndarray) -> np.ndarray:
+    '''reorders the qubits of state (ket or density matrix) such that qubit i of the result is qubit qubitOrder[i] of state'''
+    numQubits = len(qubitOrder)
+    axes = list(qubitOrder)
+    if state.ndim == 2:
+        axes += [numQubits + qubit for qubit in qubitOrder]
 
-        elif swapEndIndex < len(swapEnds) and i == swapEnds[swapEndIndex]:
-            swapStart = swapStarts[swapEndIndex]
-            swapEnd = swapEnds[swapEndIndex]
+    return state.reshape((2,)*(state.ndim*numQubits)).transpose(axes).reshape(state.shape)
 
-            swapGate[ swapEnd ][ swapStart ] = 1
 
-            swapEndIndex += 1
+def _permutationToGate(indices: np.ndarray) -> np.ndarray:
+    '''gate with a 1 at [i][indices[i]], ie) the gate which takes state indices[i] to state i'''
+    size = indices.shape[0]
+    g = np.zeros((size, size), dtype = complex)
+    g[np.arange(size), indices] = 1
+    return g
 
-        else:
-            swapGate[i][i] = 1
 
+@_cachedGate
+def genSwapGate(numQubits, q1, q2):
+    if (q1 == q2):
+        return np.eye(2**numQubits)
 
-    return swapGate
+    qubitOrder = genSwapPermutation(numQubits, q1, q2)
+    return _permutationToGate(genQubitPermutation(numQubits, qubitOrder))
 
 
 def genArbitrarySwap(hilbertDim: int, stateMap: Callable) -> np.ndarray:
+    permutation = genArbitraryPermutation(hilbertDim, stateMap)
     g = np.zeros((hilbertDim,hilbertDim),dtype=complex)
-    for i in range(0,hilbertDim):
-        g[stateMap(i)][i] = 1
+    g[permutation, np.arange(hilbertDim)] = 1
 
     return g
 
 
+@_cachedGate
 def genShiftGate(numQubits: int, up:bool, numShifts = 1) -> np.ndarray:
     '''
     PLEASE NOTE: behavior can be counter intuitive, operator shifts rails up/down, not gates
@@ -148,14 +261,8 @@ def genShiftGate(numQubits: int, up:bool, numShifts = 1) -> np.ndarray:
     Can be thought of as many swap gates that have the effect of shifting all rails up or down with wrapping
     aka shifting up causes the 0th rail to become the last, the 1st to become the 0th, the 2nd to become the 1st, etc
     '''
-    hilbertDim = 2**numQubits
-
-    if up:
-        stateMap = lambda state: (state << numShifts)%hilbertDim | (state << numShifts) // hilbertDim
-    else:
-        stateMap = lambda state: (state >> numShifts) | (state & (2**(numShifts) - 1)) << (numQubits-numShifts)
-
-    return genArbitrarySwap(hilbertDim, stateMap)
+    qubitOrder = genShiftPermutation(numQubits, up, numShifts)
+    return _permutationToGate(genQubitPermutation(numQubits, qubitOrder))
 
 
 def genGateForFullHilbertSpace(numQubits: int, firstTargetQubit: int, gate: np.ndarray):
@@ -225,6 +332,7 @@ def genControlledGate(numQubits,controlQubit,firstTargetQubit,gate):
     return swapGate @ g @ swapGate
 
 
+@_cachedGate
 def genMultiControlledGate(numQubits:int, controlQubits:list[int], firstTargetQubit:int, gate:np.ndarray):
     targetSize = _checkGate(gate)
 
@@ -278,3 +386,153 @@ def genMultiControlledGate(numQubits:int, controlQubits:list[int], firstTargetQu
 def applyGate(gate, density) -> np.ndarray:
     return gate @ density @ gate.conj().T
 
+
+def _applyToAxes(tensor: np.ndarray, gate: np.ndarray, axes: list[int]) -> np.ndarray:
+    '''
+    contracts a k qubit gate with k qubit axes of tensor (all axes of size 2), axis order of tensor is preserved
+    '''
+    k = len(axes)
+    result = np.tensordot(gate.reshape((2,)*(2*k)), tensor, axes=(list(range(k, 2*k)), axes))
+
+    # tensordot puts the gate's output axes first, move them back to where the targets were
+    return np.moveaxis(result, list(range(k)), axes)
+
+
+def applyLocalGate(gate: np.ndarray, state: np.ndarray, firstTargetQubit: int) -> np.ndarray:
+    '''
+    applies gate to the qubits starting at firstTargetQubit without expanding it to the full hilbertspace,
+    state is reshaped into a tensor with one axis per qubit (two for density matrices) and only the target axes are contracted
+    '''
+    size = _checkGate(gate)
+
+    gateNumQubits = log2(size)
+    numQubits = log2(state.shape[0])
+
+    if(firstTargetQubit + gateNumQubits - 1 >= numQubits):
+        raise IndexError(f"{gateNumQubits} qubit gate does not fit the {numQubits} qubit hilbertspace when started on qubit {firstTargetQubit}")
+
+    targets = list(range(firstTargetQubit, firstTargetQubit + gateNumQubits))
+
+    tensor = state.reshape((2,)*(state.ndim*numQubits))
+    tensor = _applyToAxes(tensor, gate, targets)
+
+    # density matrices also have gate.conj().T applied from the right, ie) gate.conj() contracted with the column axes
+    if state.ndim == 2:
+        tensor = _applyToAxes(tensor, gate.conj(), [numQubits + target for target in targets])
+
+    return tensor.reshape(state.shape)
+
+
+def applyControlledGate(gate: np.ndarray, state: np.ndarray, controlQubits: list[int], firstTargetQubit: int) -> np.ndarray:
+    '''
+    applies gate to the qubits starting at firstTargetQubit, controlled by controlQubits, without building the controlled gate,
+    gate is only contracted with the block of state where all controls are |1〉 (rows and columns for density matrices)
+    '''
+    size = _checkGate(gate)
+
+    gateNumQubits = log2(size)
+    numQubits = log2(state.shape[0])
+
+    if(firstTargetQubit + gateNumQubits - 1 >= numQubits):
+        raise IndexError(f"{gateNumQubits} qubit gate does not fit the {numQubits} qubit hilbertspace when started on qubit {firstTargetQubit}")
+
+    targets = list(range(firstTargetQubit, firstTargetQubit + gateNumQubits))
+    controlQubits = sorted(set(controlQubits))
+
+    for controlQubit in controlQubits:
+        if controlQubit < 0 or controlQubit >= numQubits:
+            raise IndexError(f"control qubit {controlQubit} outside of the {numQubits} qubit hilbertspace")
+        if controlQubit in targets:
+            raise IndexError(f"control qubit {controlQubit} overlaps with target qubits {targets}")
+
+    # indexing out the control axes removes them from the block, so target axes shift down
+    remaining = [q for q in range(numQubits) if q not in controlQubits]
+    blockTargets = [remaining.index(target) for target in targets]
+
+    # real states are promoted, writing a complex block into them would drop the imaginary part
+    tensor = state.reshape((2,)*(state.ndim*numQubits)).astype(np.result_type(state, gate))
+
+    rowIndex = [slice(None)]*tensor.ndim
+    for controlQubit in controlQubits:
+        rowIndex[controlQubit] = 1
+    rowIndex = tuple(rowIndex)
+    tensor[rowIndex] = _applyToAxes(tensor[rowIndex], gate, blockTargets)
+
+    if state.ndim == 2:
+        colIndex = [slice(None)]*tensor.ndim
+        for controlQubit in controlQubits:
+            colIndex[numQubits + controlQubit] = 1
+        colIndex = tuple(colIndex)
+        tensor[colIndex] = _applyToAxes(tensor[colIndex], gate.conj(), [numQubits + target for target in blockTargets])
+
+    return tensor.reshape(state.shape)
+
+
+
+def _applyToAxesBatched(tensor: np.ndarray, gates: np.ndarray, axes: list[int]) -> np.ndarray:
+    '''
+    _applyToAxes for a stack of gates (m, 2^k, 2^k), tensor has a leading batch axis of size 1 (shared by all gates) or m,
+    the target axes are flattened so all gates are applied with one batched matmul
+    '''
+    k = len(axes)
+    axes = [axis + 1 for axis in axes]
+    front = list(range(1, k + 1))
+
+    moved = np.moveaxis(tensor, axes, front)
+    result = np.matmul(gates, moved.reshape(moved.shape[0], 2**k, -1))
+    result = result.reshape((gates.shape[0],) + moved.shape[1:])
+
+    return np.moveaxis(result, front, axes)
+
+
+def applyGateEnsamble(probs: list[float], gates: np.ndarray, state: np.ndarray, controlQubits: list[int], firstTargetQubit: int) -> np.ndarray:
+    '''
+    density matrix of state after one of gates (stacked (m, 2^k, 2^k), all on the same targets and controls) is applied,
+    each with its probability in probs, all gates are applied together rather than once per gate
+    '''
+    size = _checkGate(gates[0])
+
+    gateNumQubits = log2(size)
+    numQubits = log2(state.shape[0])
+
+    if(firstTargetQubit + gateNumQubits - 1 >= numQubits):
+        raise IndexError(f"{gateNumQubits} qubit gate does not fit the {numQubits} qubit hilbertspace when started on qubit {firstTargetQubit}")
+
+    targets = list(range(firstTargetQubit, firstTargetQubit + gateNumQubits))
+    controlQubits = sorted(set(controlQubits))
+
+    for controlQubit in controlQubits:
+        if controlQubit < 0 or controlQubit >= numQubits:
+            raise IndexError(f"control qubit {controlQubit} outside of the {numQubits} qubit hilbertspace")
+        if controlQubit in targets:
+            raise IndexError(f"control qubit {controlQubit} overlaps with target qubits {targets}")
+
+    m = gates.shape[0]
+    tensor = state.reshape((1,) + (2,)*(state.ndim*numQubits))
+
+    if len(controlQubits) == 0:
+        tensor = _applyToAxesBatched(tensor, gates, targets)
+        if state.ndim == 2:
+            tensor = _applyToAxesBatched(tensor, gates.conj(), [numQubits + target for target in targets])
+    else:
+        # same blocks as applyControlledGate, with a copy of the state per gate
+        remaining = [q for q in range(numQubits) if q not in controlQubits]
+        blockTargets = [remaining.index(target) for target in targets]
+        tensor = np.repeat(tensor.astype(np.result_type(tensor, gates)), m, axis = 0)
+
+        rowIndex = [slice(None)]*tensor.ndim
+        for controlQubit in controlQubits:
+            rowIndex[1 + controlQubit] = 1
+        rowIndex = tuple(rowIndex)
+        tensor[rowIndex] = _applyToAxesBatched(tensor[rowIndex], gates, blockTargets)
+
+        if state.ndim == 2:
+            colIndex = [slice(None)]*tensor.ndim
+            for controlQubit in controlQubits:
+                colIndex[1 + numQubits + controlQubit] = 1
+            colIndex = tuple(colIndex)
+            tensor[colIndex] = _applyToAxesBatched(tensor[colIndex], gates.conj(), [numQubits + target for target in blockTargets])
+
+    if state.ndim == 1:
+        return ketEnsambleToDensity(probs, tensor.reshape(m, -1))
+    return np.tensordot(np.asarray(probs, dtype = float), tensor, 1).reshape(state.shape).astype(complex, copy = False)
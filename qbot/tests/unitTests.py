@@ -1,14 +1,19 @@
 import unittest
+import contextlib
+import io
 
 import numpy as np
 import os
+import subprocess
+import sys
 import qbot.qgates as gates
-from qbot.evaluation import globalNameSpace
-from qbot.interpreter import executeTxt, executeFile
+from qbot.evaluation import globalNameSpace, wrappedNameSpace, LazyNameSpace, CodeCache, Expression, expressionNames, evaluate, isPure
+from qbot.interpreter import executeTxt, executeFile, compileLines
+from qbot.operators import operations
 import qbot.density as density
 import qbot.basis as basis
 import qbot.measurement as meas
-from qbot.probVal import ProbVal
+from qbot.probVal import ProbVal, NumericProbVal, StackedProbVal, ProbValExpr, ApproximationPolicy, setApproximationPolicy, funcWrapper, defer
 
 ################################################################
 # NOTE: all static control gates are only used for unittesting #
@@ -164,7 +169,168 @@ class testGates(unittest.TestCase):
 
         areEqual = np.array_equal(toffoli,createdToffoli) and np.array_equal(toffoli,multiToffoli)
         self.assertTrue(areEqual)
-    
+
+    def test_applyLocalGate(self):
+        rng = np.random.default_rng(0)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = np.outer(ket, ket.conj())
+        for g in (globalNameSpace['hadamardGate'], qft2, toffoli):
+            gateNumQubits = int(np.log2(g.shape[0]))
+            for firstTarget in range(0, numQubits - gateNumQubits + 1):
+                fullGate = gates.genGateForFullHilbertSpace(numQubits, firstTarget, g)
+                self.assertTrue(np.allclose(gates.applyLocalGate(g, state, firstTarget), gates.applyGate(fullGate, state)))
+                self.assertTrue(np.allclose(gates.applyLocalGate(g, ket, firstTarget), fullGate @ ket))
+
+    def test_applyControlledGate(self):
+        rng = np.random.default_rng(1)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = np.outer(ket, ket.conj())
+        layouts = [
+            ([0], 1, globalNameSpace['pauliXGate']),
+            ([3], 0, globalNameSpace['hadamardGate']),
+            ([0, 3], 1, qft2),
+            ([2, 0], 3, globalNameSpace['pauliYGate']),
+            ([1, 2, 3], 0, globalNameSpace['hadamardGate']),
+        ]
+        for controls, firstTarget, g in layouts:
+            # projector onto controls being |1〉, the controlled gate is then (I - P) + P @ U
+            projector = density.tensorProd(*[basis.computation[1] if q in controls else np.eye(2) for q in range(numQubits)])
+            fullGate = np.eye(2**numQubits) - projector + projector @ gates.genGateForFullHilbertSpace(numQubits, firstTarget, g)
+            self.assertTrue(np.allclose(gates.applyControlledGate(g, state, controls, firstTarget), gates.applyGate(fullGate, state)))
+            self.assertTrue(np.allclose(gates.applyControlledGate(g, ket, controls, firstTarget), fullGate @ ket))
+
+        # real states under a complex gate keep the imaginary part, CY|10〉 = i|11〉
+        ket = np.array([0., 0, 1, 0])
+        pauliY = globalNameSpace['pauliYGate']
+        self.assertTrue(np.allclose(gates.applyControlledGate(pauliY, ket, [0], 1), [0, 0, 0, 1j]))
+        self.assertTrue(np.allclose(gates.applyControlledGate(pauliY, np.outer(ket, ket), [0], 1), np.diag([0, 0, 0, 1])))
+
+    def test_vectorizedGates(self):
+        for numQubits in range(1, 5):
+            size = 2**numQubits
+            qft = gates.genQFT(numQubits)
+            for i in range(size):
+                for j in range(size):
+                    self.assertTrue(np.isclose(qft[i][j], np.exp(2j*np.pi*i*j/size)/np.sqrt(size)))
+
+            # array aware and per state functions
+            for f in (lambda x: x & 1, lambda x: 1 if x == 1 else 0):
+                simons = gates.genSimonsGate(numQubits, f)
+                for i in range(size):
+                    x, b = i // 2, i % 2
+                    expected = np.zeros(size)
+                    expected[(x << 1) + (f(x) + b) % 2] = 1
+                    self.assertTrue(np.array_equal(simons[i], expected))
+
+    def test_gateCache(self):
+        cache = gates.GateCache(maxBytes = 2 * gates.genQFT(2).nbytes)
+        first = cache.get(('qft', 2), lambda: gates.genQFT.__wrapped__(2))
+        self.assertIs(cache.get(('qft', 2), lambda: gates.genQFT.__wrapped__(2)), first)
+        self.assertFalse(first.flags.writeable)
+
+        cache.get(('swap', 2), lambda: gates.genSwapGate.__wrapped__(2, 0, 1))
+        cache.get(('shift', 2), lambda: gates.genShiftGate.__wrapped__(2, True))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'bytes': 2 * first.nbytes, 'maxBytes': cache.maxBytes})
+
+        # gates over the budget are not cached
+        self.assertTrue(cache.get(('qft', 3), lambda: gates.genQFT.__wrapped__(3)).flags.writeable)
+        self.assertEqual(cache.stats()['size'], 2)
+
+        # arrays are keyed by content, callers get a writeable copy
+        gates.gateCache.clear()
+        x = globalNameSpace['pauliXGate']
+        controlled = gates.genMultiControlledGate(3, [0, 1], 2, x)
+        hits = gates.gateCache.hits
+        self.assertTrue(np.array_equal(gates.genMultiControlledGate(3, [0, 1], 2, x.copy()), controlled))
+        self.assertEqual(gates.gateCache.hits, hits + 1)
+        self.assertFalse(np.array_equal(gates.genMultiControlledGate(3, [0, 1], 2, globalNameSpace['pauliZGate']), controlled))
+        self.assertTrue(controlled.flags.writeable)
+        controlled[0][0] = 0
+        self.assertEqual(gates.genMultiControlledGate(3, [0, 1], 2, x)[0][0], 1)
+
+        # gates built from functions are not cached, the function may depend on outside state
+        flip = [0]
+        misses = gates.gateCache.misses
+        f = lambda x: flip[0]
+        simons = gates.genSimonsGate(2, f)
+        flip[0] = 1
+        self.assertFalse(np.array_equal(gates.genSimonsGate(2, f), simons))
+        self.assertEqual(gates.gateCache.misses, misses)
+
+    def test_applyGateEnsamble(self):
+        rng = np.random.default_rng(2)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = 0.75*np.outer(ket, ket.conj()) + 0.25*np.eye(2**numQubits)/2**numQubits
+        probs = [0.2, 0.3, 0.5]
+        stack = np.stack([qft2, density.tensorProd(globalNameSpace['hadamardGate'], globalNameSpace['pauliXGate']), np.eye(4)])
+        for controls in ([], [0], [0, 3]):
+            for s in (ket, state):
+                expected = sum(
+                    prob*density.stateToDensity(gates.applyControlledGate(g, s, controls, 1) if controls else gates.applyLocalGate(g, s, 1))
+                    for prob, g in zip(probs, stack)
+                )
+                self.assertTrue(np.allclose(gates.applyGateEnsamble(probs, stack, s, controls, 1), expected))
+
+    def test_applyQubitPermutation(self):
+        numQubits = 4
+        # distinct single qubit states, so the state of any reordering of the qubits is an independent reference
+        kets = [
+            np.array([1, 0], dtype = complex),
+            np.array([0, 1], dtype = complex),
+            np.array([1, 1], dtype = complex) / np.sqrt(2),
+            np.array([1, 1j], dtype = complex) / np.sqrt(2),
+        ]
+        ket = density.tensorProd(*kets)
+        state = density.ketToDensity(ket)
+
+        for q1 in range(0, numQubits):
+            for q2 in range(0, numQubits):
+                order = list(range(numQubits))
+                order[q1], order[q2] = order[q2], order[q1]
+                expected = density.tensorProd(*[kets[q] for q in order])
+
+                qubitOrder = gates.genSwapPermutation(numQubits, q1, q2)
+                self.assertTrue(np.allclose(gates.applyQubitPermutation(qubitOrder, ket), expected))
+                self.assertTrue(np.allclose(gates.applyQubitPermutation(qubitOrder, state), density.ketToDensity(expected)))
+                self.assertTrue(np.allclose(gates.genSwapGate(numQubits, q1, q2) @ ket, expected))
+
+        for up in (True, False):
+            for numShifts in range(0, numQubits):
+                # shifting up, qubit 1 becomes qubit 0 and qubit 0 becomes the last
+                order = [(q + numShifts if up else q - numShifts) % numQubits for q in range(numQubits)]
+                expected = density.tensorProd(*[kets[q] for q in order])
+
+                qubitOrder = gates.genShiftPermutation(numQubits, up, numShifts)
+                self.assertTrue(np.allclose(gates.applyQubitPermutation(qubitOrder, ket), expected))
+                self.assertTrue(np.allclose(gates.applyQubitPermutation(qubitOrder, state), density.ketToDensity(expected)))
+                self.assertTrue(np.allclose(gates.genShiftGate(numQubits, up, numShifts) @ ket, expected))
+
+        # hand written swap of qubits 0 and 1, |01〉 and |10〉 are exchanged
+        swap01 = np.array([
+            [1, 0, 0, 0],
+            [0, 0, 1, 0],
+            [0, 1, 0, 0],
+            [0, 0, 0, 1],
+        ])
+        twoQubits = density.tensorProd(kets[2], kets[3])
+        self.assertTrue(np.allclose(gates.applyQubitPermutation(gates.genSwapPermutation(2, 0, 1), twoQubits), swap01 @ twoQubits))
+
+    def test_applyPermutation(self):
+        hilbertDim = 8
+        state = density.tensorProd(basis.hadamard[0], basis.computation[1], basis.hadamard[1])
+        ket = density.tensorProd(basis.hadamard.kets[0], basis.computation.kets[1], basis.hadamard.kets[1])
+        for stateMap in (lambda i: (i + 3) % hilbertDim, lambda i: hilbertDim - 1 - i, lambda i: [5, 2, 0, 1, 7, 6, 3, 4][i]):
+            permutation = gates.genArbitraryPermutation(hilbertDim, stateMap)
+            g = gates.genArbitrarySwap(hilbertDim, stateMap)
+            self.assertTrue(np.allclose(gates.applyPermutation(permutation, state), gates.applyGate(g, state)))
+            self.assertTrue(np.allclose(gates.applyPermutation(permutation, ket), g @ ket))
+
 
 class testPartialTrace(unittest.TestCase):
     def test_compareMethods1(self):
@@ -207,6 +373,25 @@ class testPartialTrace(unittest.TestCase):
         self.assertTrue(np.array_equal(a1, a2))
         self.assertTrue(np.array_equal(b1, b2))
 
+    def test_compareMethods4(self):
+        rng = np.random.default_rng(2)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = np.outer(ket, ket.conj())
+        for systemAQubits in ([0], [2], [1, 3], [0, 2, 3], [3, 0]):
+            systemBQubits = [i for i in range(numQubits) if i not in systemAQubits]
+            swapped = gates.applyQubitPermutation(sorted(systemAQubits) + systemBQubits, state)
+            a1, b1 = density.partialTraceBoth(swapped, len(systemAQubits), len(systemBQubits))
+            a2, b2 = density.partialTraceArbitrary(state, numQubits, systemAQubits)
+            self.assertTrue(np.allclose(a1, a2))
+            self.assertTrue(np.allclose(b1, b2))
+
+            # tracing out then interweaving a product state gives back the product state
+            product = density.interweaveDensities(a2, b2, systemAQubits)
+            self.assertTrue(np.allclose(density.partialTraceArbitrary(product, numQubits, systemAQubits)[0], a2))
+            self.assertTrue(np.allclose(density.partialTraceArbitrary(product, numQubits, systemBQubits)[0], b2))
+
     def test_replaceArbitrary1(self):
         bell00 = basis.bell.density[0]
         comp0 = basis.computation.density[0]
@@ -279,7 +464,9 @@ class testMeasurment(unittest.TestCase):
         state = density.ketsToDensity([basis.bell.kets[0]])
         measurementResult = meas.measureArbitraryMultiState(state, basis.hadamard, [0])
         self.assertListEqual(measurementResult.probs,[0.5,0.5])
-        self.assertTrue(np.allclose( measurementResult.newState, density.tensorExp(density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density), 2) ))
+        # measurement dephases the bell state in the hadamard basis, keeping the correlation between qubits
+        expectedState = density.densityEnsambleToDensity([0.5, 0.5], [density.tensorExp(basis.hadamard[0], 2), density.tensorExp(basis.hadamard[1], 2)])
+        self.assertTrue(np.allclose(measurementResult.newState, expectedState))
     
     def test_measureArbitrary2(self):
         state = basis.bell[0]
@@ -292,7 +479,9 @@ class testMeasurment(unittest.TestCase):
         state = basis.bell[0]
         measurementResult = meas.measureArbitraryMultiState(state, basis.hadamard, [1])
         self.assertListEqual(measurementResult.probs,[0.5, 0.5])
-        self.assertTrue(np.allclose( measurementResult.newState, density.tensorExp(density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density), 2) ))
+        # measurement dephases the bell state in the hadamard basis, keeping the correlation between qubits
+        expectedState = density.densityEnsambleToDensity([0.5, 0.5], [density.tensorExp(basis.hadamard[0], 2), density.tensorExp(basis.hadamard[1], 2)])
+        self.assertTrue(np.allclose(measurementResult.newState, expectedState))
     
     def test_measureArbitrary4(self):
         state = density.ketsToDensity([
@@ -317,12 +506,537 @@ class testMeasurment(unittest.TestCase):
         state = basis.bell[0]
         measurementResult = meas.measureArbitraryMultiState(state, basis.computation, [0])
 
-        mixedComp = density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density)
-        expectedState = density.tensorProd(mixedComp, density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density))
+        expectedState = density.densityEnsambleToDensity([0.5, 0.5], [density.tensorExp(basis.computation[0], 2), density.tensorExp(basis.computation[1], 2)])
 
         self.assertTrue(measurementResult.probs == [0.5, 0.5])
         self.assertTrue(np.allclose(measurementResult.newState, expectedState))
 
+    def test_measurementProbs(self):
+        rng = np.random.default_rng(2)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = density.ketToDensity(ket)
+        for measBasis in basis.allBasis:
+            for targets in ([0, 1], [1, 3], [3, 0, 2, 1]):
+                # compare against the trace of each product projector
+                systemA, _ = density.partialTraceArbitrary(state, numQubits, targets)
+                numTensProd = len(targets) // measBasis.numQubits
+                expectedProbs = [
+                    np.trace(systemA @ meas.permuteBasis(numTensProd, i, measBasis)[0]).real
+                    for i in range(len(measBasis.kets)**numTensProd)
+                ]
+                for s in (state, ket):
+                    measurementResult = meas.measureArbitraryMultiState(s, measBasis, targets, False)
+                    self.assertTrue(np.allclose(measurementResult.probs, expectedProbs))
+
+    def test_measuredState(self):
+        rng = np.random.default_rng(3)
+        numQubits = 3
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = density.ketToDensity(ket)
+        for measBasis, targets in ((basis.computation, [0, 2]), (basis.hadamard, [1]), (basis.bell, [2, 0])):
+            # sum of P ρ P over every outcome projector P
+            numTensProd = len(targets) // measBasis.numQubits
+            expectedState = np.zeros(state.shape, dtype = complex)
+            for i in range(len(measBasis.kets)**numTensProd):
+                systemA = meas.permuteBasis(numTensProd, i, measBasis)[0]
+                projector = density.interweaveDensities(systemA, np.eye(2**(numQubits - len(targets))), targets)
+                expectedState += projector @ state @ projector
+            for s in (state, ket):
+                measurementResult = meas.measureArbitraryMultiState(s, measBasis, targets)
+                self.assertTrue(np.allclose(measurementResult.newState, expectedState))
+
+    def test_lazyMeasurementResult(self):
+        state = density.tensorProd(basis.bell[0], basis.hadamard[1], basis.computation[1])
+        measurementResult = meas.measureArbitraryMultiState(state, basis.computation, [1, 2, 3], False)
+
+        self.assertEqual(len(measurementResult.basisDensity), 8)
+        self.assertEqual(len(measurementResult.basisSymbols), 8)
+        self.assertEqual(measurementResult.basisSymbols[-1], "|1〉|1〉|1〉")
+        self.assertEqual(measurementResult.basisSymbols[1:3], ["|0〉|0〉|1〉", "|0〉|1〉|0〉"])
+        for i, basisState in enumerate(measurementResult.basisDensity):
+            self.assertTrue(np.array_equal(basisState, meas.permuteBasis(3, i, basis.computation)[0]))
+
+        mixedComp = density.densityEnsambleToDensity([0.5, 0.5], basis.computation.density)
+        expectedDensity = density.tensorProd(mixedComp, basis.hadamard[1], basis.computation[1])
+        self.assertTrue(np.allclose(measurementResult.unMeasuredDensity, expectedDensity))
+        self.assertEqual(measurementResult.probs, [0, 0.25, 0, 0.25, 0, 0.25, 0, 0.25])
+        self.assertEqual(str(measurementResult).splitlines()[1], "|0〉|0〉|1〉- 0.25 (25.0%)")
+
+    def test_probOfMarginal(self):
+        rng = np.random.default_rng(4)
+        numQubits = 4
+        ket = rng.normal(size = 2**numQubits) + 1j*rng.normal(size = 2**numQubits)
+        ket /= np.linalg.norm(ket)
+        state = density.ketToDensity(ket)
+        for targets in ([2], [3, 0], [1, 2, 0, 3]):
+            expectedProbs = meas.measureArbitraryMultiState(state, basis.computation, targets, False).probs
+            for s in (state, ket):
+                probs = meas.marginal(s, targets)
+                for outcome in range(2**len(targets)):
+                    bitstring = format(outcome, f'0{len(targets)}b')
+                    # measurement orders outcomes by sorted targets
+                    sortedBitstring = ''.join(bitstring[targets.index(t)] for t in sorted(targets))
+                    expected = expectedProbs[int(sortedBitstring, 2)]
+                    self.assertAlmostEqual(probs[outcome], expected)
+                    self.assertAlmostEqual(meas.probOf(s, bitstring, targets), expected)
+                    self.assertAlmostEqual(meas.probOf(s, outcome, targets), expected)
+
+            # single int targets
+            self.assertTrue(np.allclose(meas.marginal(s, 2), meas.marginal(s, [2])))
+            self.assertAlmostEqual(meas.probOf(s, "1", 2), meas.probOf(s, "1", [2]))
+
+        localNameSpace = executeTxt(
+            '''
+            qset tensorProd(bell[0], comp[1])
+            cdef x ; probOf(state, "11", [0, 1])
+            cdef y ; marginal(state, [2, 0])
+            cdef z ; probOf(state, 1, 2)
+            '''
+        )
+        self.assertAlmostEqual(localNameSpace['x'], 0.5)
+        self.assertTrue(np.allclose(localNameSpace['y'], [0, 0, 0.5, 0.5]))
+        self.assertAlmostEqual(localNameSpace['z'], 1)
+
+    def test_measurementResultFromProbVal(self):
+        results = [meas.measureArbitraryMultiState(s, basis.computation) for s in (basis.computation[0], basis.hadamard[0])]
+        measurementResult = meas.MeasurementResult.fromProbVal(ProbVal([0.5, 0.5], results))
+        self.assertTrue(np.allclose(measurementResult.probs, [0.75, 0.25]))
+        self.assertTrue(np.allclose(measurementResult.toDensity(), measurementResult.newState))
+
+    def test_measurementResultToDensity(self):
+        rng = np.random.default_rng(3)
+        for measBasis, numTensProd in ((basis.computation, 3), (basis.hadamard, 2), (basis.bell, 2)):
+            probs = rng.random(len(measBasis.kets)**numTensProd)
+            probs /= probs.sum()
+            result = meas.MeasurementResult(None, probs.tolist(), measBasis, numTensProd)
+            expected = sum(p * meas.permuteBasis(numTensProd, i, measBasis)[0] for i, p in enumerate(probs))
+            self.assertTrue(np.allclose(result.toDensity(), expected))
+
+
+class testProbVal(unittest.TestCase):
+    def test_normalize(self):
+        pv = ProbVal([0.25, 0.25, 0.25, 0.25], [1, 2.0, 1.000001, 2])
+        self.assertEqual(pv.values, [1, 2.0])
+        self.assertEqual(pv.probs, [0.5, 0.5])
+
+        pv = ProbVal([0.5, 0.25, 0.25], [basis.hadamard[0], basis.computation[0], np.array(basis.computation[0], dtype = int)])
+        self.assertEqual(len(pv.values), 2)
+        self.assertEqual(pv.probs, [0.5, 0.5])
+
+        pv = ProbVal([0.2, 0.2, 0.2, 0.2, 0.2], [[0, 1], (0, 1), [0, 1.0], {1, 2}, {2, 1}])
+        self.assertEqual(pv.values, [[0, 1], (0, 1), {1, 2}])
+        self.assertEqual(pv.probs, [0.4, 0.2, 0.4])
+
+    def test_largeBinary(self):
+        a = ProbVal(1000*[0.001], list(range(1000)))
+        b = ProbVal(1000*[0.001], list(range(0, 2000, 2)))
+        c = a + b
+
+        # each combination has probability 0.001**2, so sums with fewer than smallVal / 0.001**2 = 10 combinations
+        # are below smallVal and removed
+        sums, combinations = np.unique(np.add.outer(a.values, b.values), return_counts = True)
+        self.assertEqual(len(c.values), np.count_nonzero(combinations >= 10))
+        self.assertLess(len(c.values), len(sums))
+        self.assertAlmostEqual(sum(c.probs), 1)
+        self.assertAlmostEqual(c.probs[c.values.index(1000)], 0.0005, places = 6)
+
+    def test_numericProbVal(self):
+        a = ProbVal([0.5, 0.5], [1, 2])
+        b = ProbVal([0.25, 0.75], [10, 20])
+        self.assertTrue(isinstance(a, NumericProbVal))
+        self.assertFalse(isinstance(ProbVal([0.5, 0.5], [1, "a"]), NumericProbVal))
+
+        self.assertTrue((a - b).isEquivalent(ProbVal([0.125, 0.375, 0.125, 0.375], [-9, -19, -8, -18])))
+        self.assertTrue((10 - a).isEquivalent(ProbVal([0.5, 0.5], [9, 8])))
+        self.assertEqual(a // b, 0)
+        self.assertTrue((a / 4).isEquivalent(ProbVal([0.5, 0.5], [0.25, 0.5])))
+        self.assertEqual(type((a * b).values[0]), int)
+
+        # bools add as ints, as in python
+        c = ProbVal([0.5, 0.5], [True, False])
+        self.assertTrue((c + ProbVal([0.5, 0.5], [True, False])).isEquivalent(ProbVal([0.25, 0.5, 0.25], [2, 1, 0])))
+
+        self.assertEqual(a > b, False)
+        self.assertTrue((a == 2).isEquivalent(ProbVal([0.5, 0.5], [True, False])))
+        self.assertTrue(((a % 2) ^ 1).isEquivalent(ProbVal([0.5, 0.5], [True, False])))
+
+        # falls back to python semantics
+        with self.assertRaises(ZeroDivisionError):
+            a / ProbVal([0.5, 0.5], [0, 1])
+        self.assertTrue((a * [0]).isEquivalent(ProbVal([0.5, 0.5], [[0], [0, 0]])))
+
+    def test_stackedProbVal(self):
+        kets = ProbVal([0.25, 0.75], [basis.computation.kets[0], basis.hadamard.kets[0]])
+        self.assertTrue(isinstance(kets, StackedProbVal))
+        self.assertEqual(kets.stack.shape, (2, 2))
+        self.assertTrue(np.shares_memory(kets.values[1], kets.stack))
+        expected = 0.25*basis.computation[0] + 0.75*basis.hadamard[0]
+        self.assertTrue(np.allclose(kets.toDensityMatrix(), expected))
+
+        densities = ProbVal([0.5, 0.5], basis.computation.density)
+        self.assertEqual(densities.stack.shape, (2, 2, 2))
+        self.assertTrue(np.allclose(densities.toDensityMatrix(), np.eye(2)/2))
+
+        # kets mixed with density matrices are not stacked
+        mixed = ProbVal([0.5, 0.5], [basis.computation.kets[0], basis.computation[1]])
+        self.assertFalse(isinstance(mixed, StackedProbVal))
+        self.assertTrue(np.allclose(mixed.toDensityMatrix(), np.eye(2)/2))
+
+    def test_funcWrapper(self):
+        f = lambda x, y, z = 0: (x, y, z)
+        self.assertEqual(funcWrapper(f, 1, 2, z = 3), (1, 2, 3))
+
+        x = ProbVal([0.5, 0.5], ["a", "b"])
+        z = ProbVal([0.25, 0.75], [3, 4])
+        result = funcWrapper(f, x, 2, z = z)
+        self.assertEqual(result.values, [("a", 2, 3), ("b", 2, 3), ("a", 2, 4), ("b", 2, 4)])
+        self.assertEqual(result.probs, [0.125, 0.125, 0.375, 0.375])
+
+    def test_sampleSpace(self):
+        x = ProbVal([0.5, 0.5], [1, 3])
+        self.assertEqual(x - x, 0)
+        self.assertTrue((2*x - x).isEquivalent(x))
+        self.assertEqual((x == 1) & (x == 3), False)
+        self.assertTrue((x.map(str) + x.map(str)).isEquivalent(ProbVal([0.5, 0.5], ["11", "33"])))
+        self.assertTrue(funcWrapper(lambda a, b: (a, b), x, -x).isEquivalent(ProbVal([0.5, 0.5], [(1, -1), (3, -3)])))
+
+        s = ProbVal([0.5, 0.5], ["a", "b"])
+        self.assertTrue((s + s).isEquivalent(ProbVal([0.5, 0.5], ["aa", "bb"])))
+
+        # independent ProbVals still combine over every pair of values
+        y = ProbVal([0.5, 0.5], [1, 3])
+        self.assertEqual(len((x + y).values), 3)
+
+        # and stay correlated with both through their joint sample space
+        y = ProbVal([0.5, 0.5], [0, 10])
+        self.assertTrue(((x + y) - x).isEquivalent(y))
+        self.assertEqual((x + y) - x == y, True)
+        self.assertEqual((x + y) - (y + x), 0)
+        self.assertEqual(funcWrapper(lambda a, b: a - b, x + y, y).values, x.values)
+        self.assertEqual(((defer(x) + y) - (x + y)).evaluate(), 0)
+        self.assertEqual((defer(x + y) - x - y).evaluate(), 0)
+
+        s = ProbVal([0.5, 0.5], ["a", "b"])
+        self.assertTrue(((s + x.map(str)) == (s + x.map(str))) is True)
+
+        localNameSpace = executeTxt(
+            '''
+            cdef x ; ProbVal([0.25, 0.25, 0.5], [1, 2, 3])
+            cdef total ; 0
+            cdef i ; 0
+            mark loop
+            cdef total ; total + x
+            cdef i ; i + 1
+            cjmp loop ; i < 10
+            '''
+        )
+        self.assertTrue(localNameSpace['total'].isEquivalent(ProbVal([0.25, 0.25, 0.5], [10, 20, 30])))
+
+    def test_statistics(self):
+        x = ProbVal([0.25, 0.25, 0.5], [1, 2, 3])
+        self.assertAlmostEqual(x.expectation(), 2.25)
+        self.assertAlmostEqual(x.variance(), 0.6875)
+        self.assertEqual(x.quantile(0.5), 2)
+        self.assertEqual(x.quantile([0.25, 0.3, 1]), [1, 2, 3])
+        self.assertAlmostEqual(x.entropy(), 1.5)
+        mass, edges = x.histogram(3)
+        self.assertTrue(np.allclose(mass, [0.25, 0.25, 0.5]))
+        self.assertEqual(len(edges), 4)
+
+        self.assertEqual(x.sample(5, 1), x.sample(5, 1))
+        self.assertTrue(set(x.sample(20)) <= {1, 2, 3})
+
+        states = ProbVal([0.5, 0.5], [np.array([1, 0]), np.array([0, 1])])
+        self.assertTrue(np.allclose(states.expectation(), [0.5, 0.5]))
+        with self.assertRaises(TypeError):
+            ProbVal([0.5, 0.5], ["a", "b"]).expectation()
+
+        localNameSpace = executeTxt(
+            '''
+            cdef x ; ProbVal([0.5, 0.5], [0, 2])
+            cdef mean ; expectation(x)
+            cdef var ; variance(x)
+            cdef h ; entropy(3)
+            '''
+        )
+        self.assertEqual(localNameSpace['mean'], 1)
+        self.assertEqual(localNameSpace['var'], 1)
+        self.assertEqual(localNameSpace['h'], 0)
+
+    def test_deferred(self):
+        a = ProbVal([0.5, 0.5], [1, 2])
+        b = ProbVal([0.25, 0.75], [3, 4])
+        x = defer(a)
+        self.assertTrue(isinstance(x + b, ProbValExpr))
+
+        # a ProbVal used more than once refers to the same outcome
+        self.assertTrue((x + x).isEquivalent(ProbVal([0.5, 0.5], [2, 4])))
+        self.assertEqual((x - a).evaluate(), 0)
+        self.assertTrue(((x + b) * a - b).isEquivalent(ProbVal([0.5, 0.125, 0.375], [1, 7, 8])))
+
+        # independent ProbVals combine as usual
+        self.assertTrue(((x + b) * 2).isEquivalent((a + b) * 2))
+        self.assertTrue((defer(ProbVal([0.5, 0.5], ["a", "b"])) * 2 == "aa").isEquivalent(ProbVal([0.5, 0.5], [True, False])))
+
+        localNameSpace = executeTxt(
+            '''
+            cdef x ; defer(ProbVal([0.5, 0.5], [1, 2]))
+            cdef y ; 2*x - x - x
+            cdef z ; 0
+            cjmp end ; y == 0
+            cdef z ; 1
+            mark end
+            '''
+        )
+        self.assertTrue(isinstance(localNameSpace['y'], ProbValExpr))
+        self.assertEqual(localNameSpace['z'], 0)
+
+    def test_approximationPolicy(self):
+        policy = ApproximationPolicy(topK = 3)
+        previous = setApproximationPolicy(policy)
+        try:
+            pv = ProbVal([0.1, 0.2, 0.3, 0.4], [1, 2, 3, 4])
+            self.assertEqual(pv.values, [2, 3, 4])
+            self.assertAlmostEqual(pv.discardedMass, 0.1)
+            pv = ProbVal([0.1, 0.2, 0.3, 0.4], ["a", "b", "c", "d"])
+            self.assertEqual(pv.values, ["b", "c", "d"])
+            self.assertAlmostEqual(policy.discardedMass, 0.2)
+
+            setApproximationPolicy(ApproximationPolicy(maxDiscardedMass = 0.35))
+            pv = ProbVal([0.1, 0.2, 0.3, 0.4], [1, 2, 3, 4])
+            self.assertEqual(pv.values, [3, 4])
+            self.assertAlmostEqual(pv.discardedMass, 0.3)
+
+            setApproximationPolicy(ApproximationPolicy(numBins = 2))
+            pv = ProbVal([0.25, 0.25, 0.25, 0.25], [0.0, 1.0, 9.0, 10.0])
+            self.assertEqual(pv.values, [0.5, 9.5])
+
+            x = ProbVal(100*[0.01], [float(i) for i in range(100)])
+            self.assertEqual(len((x + x + x).values), 2)
+
+            # accumulations stay within the policy, pruned outcomes are not brought back (or discarded again) later
+            for policy in (ApproximationPolicy(topK = 4), ApproximationPolicy(maxDiscardedMass = 0.1)):
+                setApproximationPolicy(policy)
+                total = ProbVal([0.5, 0.5], [0, 1])
+                discardedMass = 0.0
+                for _ in range(12):
+                    total = total + ProbVal([0.2, 0.3, 0.5], [0, 1, 2])
+                    space, outcomes = total.sampleSpace()
+                    self.assertLessEqual(len(space.probs), 12)
+                    self.assertEqual(len(outcomes), len(space.probs))
+                    self.assertLessEqual(total.discardedMass, 0.2)
+                    discardedMass += total.discardedMass
+                    if policy.topK is not None:
+                        self.assertLessEqual(len(total.values), 4)
+                self.assertAlmostEqual(policy.discardedMass, discardedMass)
+                self.assertEqual(total - total, 0)
+        finally:
+            setApproximationPolicy(previous)
+
+        localNameSpace = executeTxt(
+            '''
+            cdef policy ; approximate(topK = 2)
+            cdef x ; ProbVal([0.5, 0.3, 0.2], [1, 2, 3])
+            '''
+        )
+        self.assertEqual(localNameSpace['x'].values, [1, 2])
+        self.assertAlmostEqual(localNameSpace['policy'].discardedMass, 0.2)
+
+        # the policy does not outlive the script
+        self.assertEqual(len(ProbVal([0.5, 0.3, 0.2], [1, 2, 3]).values), 3)
+
+
+class testEvaluation(unittest.TestCase):
+    def test_codeCache(self):
+        cache = CodeCache(maxSize = 2)
+        code, names = cache.get("x + np_sqrt(y)")
+        self.assertEqual(eval(code, {}, {'x': 1, 'y': 4, 'np_sqrt': np.sqrt}), 3)
+        self.assertEqual(names, ('x', 'np_sqrt', 'y'))
+        self.assertIs(cache.get("x + np_sqrt(y)")[0], code)
+
+        cache.get("1")
+        cache.get("x + np_sqrt(y)")
+        cache.get("2")
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 3, 'evictions': 1, 'size': 2, 'maxSize': 2})
+
+        # "1" was least recently used
+        cache.get("x + np_sqrt(y)")
+        self.assertEqual(cache.hits, 3)
+
+        # names used inside nested code are included
+        self.assertEqual(set(expressionNames("[f(i) for i in z]")), {'f', 'z'})
+
+
+    def test_compileLines(self):
+        lines = [
+            "cdef x ; 0",
+            "",
+            "mark loop",
+            "CDEF x ; x + 1",
+            "note comment",
+            "cjmp loop ; x < 3",
+        ]
+        instructions, lineToInstruction = compileLines(lines)
+        self.assertEqual([instruction.lineNum for instruction in instructions], [0, 3, 5])
+        self.assertEqual(lineToInstruction, [0, 1, 1, 1, 2, 2, 3])
+        self.assertEqual(instructions[1].tokens, ['cdef', 'x', 'x + 1'])
+        self.assertEqual(eval(instructions[1].tokens[2].code, {}, {'x': 1}), 2)
+        # jumps to marks are resolved on load
+        self.assertEqual(instructions[2].jumpIndex, 1)
+        self.assertIsNone(instructions[1].jumpIndex)
+
+        # invalid lines only raise once reached
+        localNameSpace = executeTxt(
+            '''
+            cdef x ; 0
+            mark loop
+            cdef x ; x + 1
+            cjmp loop ; x < 3
+            halt
+            fake x
+            cdef x ; 1 ; 2
+            '''
+        )
+        self.assertEqual(localNameSpace['x'], 3)
+        self.assertTrue(all(type(key) is str for key in localNameSpace))
+
+        # unknown names are found when the script is loaded, names defined anywhere in the script are known
+        lines = [
+            "cdef y ; x + 1",
+            "cdef x ; [np_sqrt(i) for i in range(2)]",
+            "cdef z ; [i for i in (1, 2)] + [(w := 1), w]",
+            "jump end",
+            "mark end",
+        ]
+        instructions, _ = compileLines(lines)
+        self.assertIs(instructions[0].op, operations['cdef'][0])
+        self.assertIs(instructions[2].op, operations['cdef'][0])
+        self.assertIs(instructions[3].op, operations['jump'][0])
+        self.assertIsNot(instructions[1].op, operations['cdef'][0])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(SystemExit):
+            instructions[1].op({}, lines, 1, instructions[1].tokens)
+        self.assertIn("UnknownName", output.getvalue())
+        self.assertIn("range", output.getvalue())
+        self.assertEqual(set(expressionNames("[f(i) for i in z] + [(lambda a: a + b)(c)]")), {'f', 'z', 'b', 'c'})
+
+        # unknown marks are found when the script is loaded, mark names held in variables are resolved when reached
+        lines = [
+            "cdef target ; 'end'",
+            "jump target",
+            "cjmp missing ; True",
+            "mark end",
+        ]
+        instructions, _ = compileLines(lines)
+        self.assertIs(instructions[0].op, operations['cdef'][0])
+        self.assertIs(instructions[1].op, operations['jump'][0])
+        self.assertIsNone(instructions[1].jumpIndex)
+        self.assertIsNot(instructions[2].op, operations['cjmp'][0])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(SystemExit):
+            instructions[2].op({}, lines, 2, instructions[2].tokens)
+        self.assertIn("UnknownMarkName", output.getvalue())
+        self.assertIn("missing", output.getvalue())
+
+    def test_constantFolding(self):
+        self.assertTrue(isPure("tensorExp(hadamardGate, 2)"))
+        self.assertTrue(isPure("xRotGate(math_pi / 2)"))
+        self.assertTrue(isPure("computation.density[0]"))
+        self.assertFalse(isPure("tensorExp(x, 2)"))
+        self.assertFalse(isPure("ProbVal([0.5, 0.5], [0, 1])"))
+        self.assertFalse(isPure("hadamardGate.fill(0)"))
+        self.assertFalse(isPure("np_empty(2)"))
+        self.assertFalse(isPure("np_ndarray(2)"))
+        self.assertFalse(isPure("np_recarray(2, [('a', int)])"))
+        self.assertFalse(isPure("(lambda: 1)()"))
+
+        expression = Expression("qftGate(2)", *CodeCache().get("qftGate(2)"), pure = True)
+        qft = evaluate(expression, {})
+        self.assertTrue(expression.folded)
+        self.assertFalse(expression.constant.flags.writeable)
+        self.assertTrue(np.array_equal(qft, gates.genQFT(2)))
+
+        # each evaluation returns a writeable copy of the constant
+        self.assertTrue(qft.flags.writeable)
+        qft[0][0] = 0
+        self.assertTrue(np.array_equal(evaluate(expression, {}), gates.genQFT(2)))
+
+        # the constant is a copy, globals are left writeable
+        expression = Expression("hadamardGate", *CodeCache().get("hadamardGate"), pure = True)
+        self.assertIsNot(evaluate(expression, {}), globalNameSpace['hadamardGate'])
+        self.assertTrue(globalNameSpace['hadamardGate'].flags.writeable)
+
+        # script variables shadow globals
+        self.assertEqual(evaluate(expression, {'hadamardGate': 1}), 1)
+
+        # mutable results are not folded
+        expression = Expression("plist(1, 2)", *CodeCache().get("plist(1, 2)"), pure = True)
+        self.assertIsNot(evaluate(expression, {}), evaluate(expression, {}))
+        self.assertFalse(expression.pure)
+
+        localNameSpace = executeTxt(
+            '''
+            qset tensorExp(computation.density[0], 2)
+            cdef i ; 0
+            mark loop
+            gate qftGate(2) ; 0
+            cdef i ; i + 1
+            cjmp loop ; i < 4
+            '''
+        )
+        # qft^4 is the identity
+        self.assertTrue(np.allclose(localNameSpace['state'], density.tensorExp(basis.computation.density[0], 2)))
+
+        # folded arrays stored by cdef and qdef can still be modified by the script
+        localNameSpace = executeTxt(
+            '''
+            cdef i ; 0
+            mark loop
+            cdef x ; np_zeros(3)
+            qdef q ; tensorExp(computation.density[0], 2)
+            pydo x.__setitem__(i, 1)
+            pydo np_copyto(q, tensorExp(computation.density[1], 2))
+            cdef i ; i + 1
+            cjmp loop ; i < 2
+            '''
+        )
+        self.assertTrue(np.array_equal(localNameSpace['x'], [0, 1, 0]))
+        self.assertTrue(np.array_equal(localNameSpace['q'], density.tensorExp(basis.computation.density[1], 2)))
+
+    def test_lazyNameSpace(self):
+        nameSpace = LazyNameSpace({'np_sqrt': (np, 'sqrt'), 'np_missing': (np, 'notAFunction')})
+        self.assertEqual(len(nameSpace), 0)
+        self.assertEqual(nameSpace['np_sqrt'](4), 2)
+        self.assertEqual(list(nameSpace.keys()), ['np_sqrt'])
+        self.assertNotIn('np_missing', nameSpace)
+        self.assertIsNone(nameSpace.get('np_missing'))
+        self.assertEqual(len(nameSpace), 1)
+
+        self.assertIs(globalNameSpace['__builtins__'], wrappedNameSpace)
+        localNameSpace = executeTxt(
+            '''
+            cdef f ; lambda x: np_sqrt(x) + math_cos(0)
+            cdef x ; f(9)
+            '''
+        )
+        self.assertEqual(localNameSpace['x'], 4)
+
+        # no wrappers are created on import
+        script = (
+            "import time; t = time.perf_counter(); import qbot.evaluation as e; "
+            "print(time.perf_counter() - t, len(e.wrappedNameSpace), len(e.wrappedFunctions))"
+        )
+        output = subprocess.run([sys.executable, '-c', script], capture_output = True, text = True, check = True)
+        importTime, wrapped, wrappable = output.stdout.split()
+        self.assertEqual(int(wrapped), 0)
+        self.assertGreater(int(wrappable), 0)
+        self.assertLess(float(importTime), 5)
+
 
 class testOperations(unittest.TestCase):
     def test_gate(self):
@@ -425,6 +1139,25 @@ class testOperations(unittest.TestCase):
 
         self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
 
+    def test_gateProbVals4(self):
+        localNameSpace = executeTxt(
+            '''
+            qset tensorPermute(3, 1, comp)
+            gate ProbVal([0.25, 0.25, 0.5], [hadamardGate, pauliXGate, hadamardGate]) ; ProbVal([0.5, 0.5], [0, 1]) ; [2]
+            '''
+        )
+        comp0 = globalNameSpace['computation'][0]
+        comp1 = globalNameSpace['computation'][1]
+        hadaPlus = globalNameSpace['hadamard'][0]
+        expectedState = density.densityEnsambleToDensity([0.375, 0.375, 0.125, 0.125], [
+            density.tensorProd(hadaPlus, comp0, comp1),
+            density.tensorProd(comp0, hadaPlus, comp1),
+            density.tensorProd(comp1, comp0, comp1),
+            density.tensorProd(comp0, comp1, comp1),
+        ])
+
+        self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
+
     def test_discVal(self):
         localNameSpace = executeTxt(
             '''
@@ -515,6 +1248,48 @@ class testOperations(unittest.TestCase):
         self.assertTrue(np.allclose(localNameSpace['x_1234'], expectedState))
         self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
 
+    def test_ketState1(self):
+        localNameSpace = executeTxt(
+            '''
+            qset tensorProd(comp.kets[0], comp.kets[0], comp.kets[0])
+            gate hadamardGate ; 0
+            gate pauliXGate ; 2 ; [0]
+            swap 1 ; 2
+            qset hada.kets[1] ; [2]
+            '''
+        )
+        expectedState = density.tensorProd(basis.bell[0], basis.hadamard[1])
+        state = localNameSpace['state']
+        self.assertEqual(state.shape, (8,))
+        self.assertTrue(np.allclose(density.ketToDensity(state), expectedState))
+
+    def test_ketState2(self):
+        localNameSpace = executeTxt(
+            '''
+            qset tensorProd(bell.kets[0], comp.kets[0])
+            qset hada.kets[0] ; [1]
+            '''
+        )
+        # replacing half of a bell pair leaves the other half mixed
+        mixedComp = density.densityEnsambleToDensity([0.5, 0.5], basis.computation.density)
+        expectedState = density.tensorProd(mixedComp, basis.hadamard[0], basis.computation[0])
+        self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
+
+    def test_ketState3(self):
+        localNameSpace = executeTxt(
+            '''
+            qset tensorProd(hada.kets[0], comp.kets[0])
+            gate pauliXGate ; 1 ; [0]
+            meas x ; comp ; [1]
+            '''
+        )
+        expectedState = density.densityEnsambleToDensity([0.5, 0.5], [
+            density.tensorProd(basis.computation[0], basis.computation[0]),
+            density.tensorProd(basis.computation[1], basis.computation[1]),
+        ])
+        self.assertEqual(localNameSpace['x'].probs, [0.5, 0.5])
+        self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
+
 
     def test_meas1(self):
         localNameSpace = executeTxt(
@@ -546,7 +1321,8 @@ class testOperations(unittest.TestCase):
             '''
         )
         mixedComp = density.densityEnsambleToDensity([0.5, 0.5], basis.computation.density)
-        expectedState = density.tensorProd(mixedComp, density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density), basis.computation[0], mixedComp)
+        correlatedComp = density.densityEnsambleToDensity([0.5, 0.5], [density.tensorExp(basis.computation[0], 2), density.tensorExp(basis.computation[1], 2)])
+        expectedState = density.tensorProd(correlatedComp, basis.computation[0], mixedComp)
         self.assertTrue(localNameSpace['x'].probs == [0.25, 0.25, 0.25, 0.25])
         self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
 
@@ -558,7 +1334,8 @@ class testOperations(unittest.TestCase):
             '''
         )
         mixedComp = density.densityEnsambleToDensity([0.5, 0.5], basis.computation.density)
-        expectedState = density.tensorProd(mixedComp, density.densityEnsambleToDensity([0.5, 0.5], basis.hadamard.density), basis.computation[0], mixedComp)
+        correlatedComp = density.densityEnsambleToDensity([0.5, 0.5], [density.tensorExp(basis.computation[0], 2), density.tensorExp(basis.computation[1], 2)])
+        expectedState = density.tensorProd(correlatedComp, basis.computation[0], mixedComp)
         self.assertTrue(localNameSpace['x'].probs == [0.25, 0.25, 0.25, 0.25])
         self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
 
@@ -573,6 +1350,48 @@ class testOperations(unittest.TestCase):
         self.assertTrue(localNameSpace['x'].probs == [0.25, 0.25, 0.25, 0.25])
         self.assertTrue(np.allclose(localNameSpace['state'], expectedState))
 
+    def test_samp1(self):
+        script = \
+            '''
+            qset tensorProd(bell[0], comp[1])
+            samp x; comp ; 100000
+            samp y; comp ; 1000 ; 2
+            '''
+        localNameSpace = executeTxt(script, seed = 1)
+        x = localNameSpace['x']
+        self.assertEqual(x.shots, 100000)
+        self.assertEqual(set(x.keys()), {"|0〉|0〉|1〉", "|1〉|1〉|1〉"})
+        self.assertEqual(x["|0〉|0〉|1〉"] + x["|1〉|1〉|1〉"], 100000)
+        self.assertAlmostEqual(x["|1〉|1〉|1〉"] / x.shots, 0.5, delta = 0.01)
+        self.assertEqual(localNameSpace['y'].toDict(), {"|1〉": 1000})
+        self.assertTrue(np.allclose(localNameSpace['state'], density.tensorProd(basis.bell[0], basis.computation[1])))
+
+        # seeded runs are reproducible
+        self.assertTrue(np.array_equal(executeTxt(script, seed = 1)['x'].counts, x.counts))
+
+    def test_samp2(self):
+        localNameSpace = executeTxt(
+            '''
+            qset tensorProd(hada[0], bell[2])
+            samp x; bell ; 10 ; [1, 2]
+            ''',
+            seed = 2
+        )
+        self.assertEqual(localNameSpace['x'].toDict(), {"|β₁₀〉": 10})
+        self.assertEqual(localNameSpace['x'][2], 10)
+
+    def test_samp3(self):
+        localNameSpace = executeTxt(
+            '''
+            qset comp[1]
+            samp x; comp ; np_int64(100)
+            samp y; comp ; np_sum(np_array([1, 2, 3]))
+            '''
+        )
+        self.assertEqual(localNameSpace['x'].toDict(), {"|1〉": 100})
+        self.assertEqual(type(localNameSpace['x'].shots), int)
+        self.assertEqual(localNameSpace['y'].shots, 6)
+
     def test_halt1(self):
         localNameSpace = executeTxt(
             '''